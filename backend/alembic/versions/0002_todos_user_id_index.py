@@ -0,0 +1,29 @@
+"""index todos.user_id
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # Build the index without blocking writes on a large table
+        with op.get_context().autocommit_block():
+            op.create_index('ix_todos_user_id', 'todos', ['user_id'], postgresql_concurrently=True)
+    else:
+        op.create_index('ix_todos_user_id', 'todos', ['user_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todos_user_id', table_name='todos')
@@ -0,0 +1,86 @@
+"""prepare hash partitioning of todos by user_id
+
+Creates `todos_partitioned`, a copy of `todos` hash-partitioned on user_id,
+and a trigger that mirrors every write on `todos` into it. Existing rows are
+copied in batches and the tables swapped by `scripts/partition_todos.py`, so
+no step holds a long lock. PostgreSQL only; other dialects skip this revision.
+
+The number of partitions is read from TODOS_PARTITIONS (default 16).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    partitions = int(os.getenv('TODOS_PARTITIONS', '16'))
+
+    # LIKE keeps the column order identical to todos (so rows can be copied
+    # with SELECT *) and shares the todos_id_seq default. The partition key
+    # must be part of the primary key.
+    op.execute("""
+        CREATE TABLE todos_partitioned (
+            LIKE todos INCLUDING DEFAULTS,
+            PRIMARY KEY (user_id, id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(partitions):
+        op.execute(
+            f"CREATE TABLE todos_partitioned_p{remainder} PARTITION OF todos_partitioned "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        )
+    op.execute("CREATE INDEX ix_todos_partitioned_id ON todos_partitioned (id)")
+    op.execute("CREATE INDEX ix_todos_partitioned_title ON todos_partitioned (title)")
+
+    op.execute("""
+        CREATE FUNCTION todos_mirror_to_partitioned() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM todos_partitioned WHERE user_id = OLD.user_id AND id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO todos_partitioned SELECT (NEW).* ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER todos_mirror_to_partitioned
+        AFTER INSERT OR UPDATE OR DELETE ON todos
+        FOR EACH ROW EXECUTE FUNCTION todos_mirror_to_partitioned()
+    """)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    has_mirror = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_trigger WHERE tgname = 'todos_mirror_to_partitioned'"
+    )).first()
+    if not has_mirror:
+        raise RuntimeError(
+            "todos has already been swapped to the partitioned table; "
+            "this revision can't be downgraded automatically"
+        )
+
+    op.execute("DROP TRIGGER todos_mirror_to_partitioned ON todos")
+    op.execute("DROP FUNCTION todos_mirror_to_partitioned()")
+    op.execute("DROP TABLE todos_partitioned")
@@ -0,0 +1,52 @@
+"""todos archive table
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'todos_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('completed', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_todos_archive_user_id', 'todos_archive', ['user_id'])
+
+    candidates = sa.func.coalesce(sa.column('updated_at'), sa.column('created_at'))
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(
+                'ix_todos_archive_candidates', 'todos', [candidates],
+                postgresql_where=sa.text('completed'), postgresql_concurrently=True,
+            )
+    else:
+        op.create_index(
+            'ix_todos_archive_candidates', 'todos', [candidates],
+            sqlite_where=sa.text('completed'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todos_archive_candidates', table_name='todos')
+    op.drop_index('ix_todos_archive_user_id', table_name='todos_archive')
+    op.drop_table('todos_archive')
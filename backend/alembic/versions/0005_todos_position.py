@@ -0,0 +1,75 @@
+"""manual ordering position for todos
+
+Adds a nullable `position` order key (see app/services/ordering.py) and a
+(user_id, position) index. Existing rows keep a NULL position; they sort
+after positioned todos and get keys the first time their owner moves a todo,
+so the upgrade does not rewrite the table. Tables created by the
+partitioning migration get the column too, keeping the mirror trigger's
+SELECT (NEW).* column-compatible.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# Partitioning companions of todos that may exist (0003 / scripts/partition_todos.py)
+COMPANION_TABLES = ('todos_partitioned', 'todos_unpartitioned')
+
+
+def _position_type(dialect: str):
+    # Keys must compare bytewise, not by the database's locale collation
+    return sa.String(collation='C') if dialect == 'postgresql' else sa.String()
+
+
+def _existing_companions():
+    inspector = sa.inspect(op.get_bind())
+    return [table for table in COMPANION_TABLES if inspector.has_table(table)]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    op.add_column('todos', sa.Column('position', _position_type(dialect), nullable=True))
+    op.add_column('todos_archive', sa.Column('position', _position_type(dialect), nullable=True))
+    companions = _existing_companions()
+    for table in companions:
+        op.add_column(table, sa.Column('position', _position_type(dialect), nullable=True))
+
+    if dialect == 'postgresql':
+        is_partitioned = op.get_bind().execute(sa.text(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = 'todos'::regclass"
+        )).scalar()
+        if 'todos_partitioned' in companions:
+            # Renamed to ix_todos_user_id_position by the swap
+            op.create_index('ix_todos_partitioned_user_id_position', 'todos_partitioned', ['user_id', 'position'])
+        if is_partitioned:
+            # CONCURRENTLY is not supported on partitioned tables
+            op.create_index('ix_todos_user_id_position', 'todos', ['user_id', 'position'])
+        else:
+            with op.get_context().autocommit_block():
+                op.create_index(
+                    'ix_todos_user_id_position', 'todos', ['user_id', 'position'],
+                    postgresql_concurrently=True,
+                )
+    else:
+        op.create_index('ix_todos_user_id_position', 'todos', ['user_id', 'position'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todos_user_id_position', table_name='todos')
+    companions = _existing_companions()
+    if 'todos_partitioned' in companions:
+        op.drop_index('ix_todos_partitioned_user_id_position', table_name='todos_partitioned')
+    for table in companions:
+        op.drop_column(table, 'position')
+    op.drop_column('todos_archive', 'position')
+    op.drop_column('todos', 'position')
@@ -0,0 +1,57 @@
+"""composite (user_id, sort key) indexes on todos
+
+One index per sort key accepted by the todo query builder, so sorted pages
+of one user's todos are read in index order.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# (user_id, position) already exists from 0005
+SORT_COLUMNS = ('created_at', 'updated_at', 'title', 'completed', 'id')
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        for column in SORT_COLUMNS:
+            op.create_index(f'ix_todos_user_id_{column}', 'todos', ['user_id', column])
+        return
+
+    is_partitioned = bind.execute(sa.text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = 'todos'::regclass"
+    )).scalar()
+    if sa.inspect(bind).has_table('todos_partitioned'):
+        # Renamed to ix_todos_user_id_* by the swap
+        for column in SORT_COLUMNS:
+            op.create_index(f'ix_todos_partitioned_user_id_{column}', 'todos_partitioned', ['user_id', column])
+    if is_partitioned:
+        # CONCURRENTLY is not supported on partitioned tables
+        for column in SORT_COLUMNS:
+            op.create_index(f'ix_todos_user_id_{column}', 'todos', ['user_id', column])
+        return
+    with op.get_context().autocommit_block():
+        for column in SORT_COLUMNS:
+            op.create_index(
+                f'ix_todos_user_id_{column}', 'todos', ['user_id', column],
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    has_companion = sa.inspect(op.get_bind()).has_table('todos_partitioned')
+    for column in SORT_COLUMNS:
+        op.drop_index(f'ix_todos_user_id_{column}', table_name='todos')
+        if has_companion:
+            op.drop_index(f'ix_todos_partitioned_user_id_{column}', table_name='todos_partitioned')
@@ -0,0 +1,29 @@
+"""job leases: heartbeat and attempt count
+
+Running jobs are heartbeated by their worker; claim_next_job requeues (or
+fails) running jobs whose heartbeat is older than JOBS_LEASE_SECONDS.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('jobs', sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('jobs', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('jobs', 'attempts')
+    op.drop_column('jobs', 'heartbeat_at')
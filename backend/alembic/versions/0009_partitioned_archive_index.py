@@ -0,0 +1,51 @@
+"""archive candidates index on the partitioned todos table
+
+0004 created ix_todos_archive_candidates on `todos` only, so once
+`scripts/partition_todos.py swap` replaced it with `todos_partitioned` the
+archive mover scanned the whole table. Create the index on the companion
+table (renamed to ix_todos_archive_candidates by the swap), and on `todos`
+if it was swapped without it. PostgreSQL only.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def _has_index(bind, name):
+    return bind.execute(sa.text("SELECT 1 FROM pg_indexes WHERE indexname = :name"), {"name": name}).first() is not None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    candidates = sa.func.coalesce(sa.column('updated_at'), sa.column('created_at'))
+    if sa.inspect(bind).has_table('todos_partitioned') and not _has_index(bind, 'ix_todos_partitioned_archive_candidates'):
+        op.create_index(
+            'ix_todos_partitioned_archive_candidates', 'todos_partitioned', [candidates],
+            postgresql_where=sa.text('completed'),
+        )
+    if not _has_index(bind, 'ix_todos_archive_candidates'):
+        # Only missing once todos is the (swapped-in) partitioned table, where
+        # CONCURRENTLY is not supported
+        op.create_index(
+            'ix_todos_archive_candidates', 'todos', [candidates],
+            postgresql_where=sa.text('completed'),
+        )
+
+
+def downgrade() -> None:
+    # The indexes are part of the schema 0004 intended; keep them
+    pass
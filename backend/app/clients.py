@@ -0,0 +1,29 @@
+import threading
+from .database import settings
+
+# Shared clients for optional backing services. They are created on first use
+# so importing the app never opens connections or imports the client libraries.
+_redis_client = None
+_lock = threading.Lock()
+
+def get_redis():
+    """Return the shared Redis client, creating it on first use."""
+    global _redis_client
+    if _redis_client is None:
+        with _lock:
+            if _redis_client is None:
+                import redis
+                _redis_client = redis.Redis.from_url(
+                    settings.redis_url,
+                    decode_responses=True,
+                    socket_connect_timeout=1,
+                    socket_timeout=1,
+                )
+    return _redis_client
+
+def close_clients():
+    global _redis_client
+    with _lock:
+        if _redis_client is not None:
+            _redis_client.close()
+            _redis_client = None
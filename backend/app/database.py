@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from pydantic_settings import BaseSettings
 import os
 from dotenv import load_dotenv
+from .deadline import check_deadline, remaining_time, DeadlineExceeded
 
 load_dotenv()
 
@@ -12,6 +13,81 @@ class Settings(BaseSettings):
     algorithm: str = os.getenv("ALGORITHM", "HS256")
     access_token_expire_minutes: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     environment: str = os.getenv("ENVIRONMENT", "development")
+    redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # Schema is managed by Alembic (`alembic upgrade head`). DB_BOOTSTRAP=true
+    # creates missing tables on startup for throwaway dev databases.
+    db_bootstrap: bool = os.getenv("DB_BOOTSTRAP", "false").lower() == "true"
+
+    # Response compression
+    compression_enabled: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    compression_minimum_size: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+    compression_level: int = int(os.getenv("COMPRESSION_LEVEL", "6"))
+    brotli_quality: int = int(os.getenv("BROTLI_QUALITY", "4"))
+
+    # Background jobs. Set JOBS_WORKERS=0 when jobs run in a separate
+    # `python -m app.worker` process.
+    jobs_workers: int = int(os.getenv("JOBS_WORKERS", "1"))
+    jobs_poll_interval_seconds: float = float(os.getenv("JOBS_POLL_INTERVAL_SECONDS", "2"))
+    jobs_result_dir: str = os.getenv("JOBS_RESULT_DIR", "./job_results")
+    jobs_max_active_per_user: int = int(os.getenv("JOBS_MAX_ACTIVE_PER_USER", "2"))
+    # A running job whose worker hasn't heartbeated for this long is requeued,
+    # or failed once it has been claimed jobs_max_attempts times
+    jobs_lease_seconds: float = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+    jobs_max_attempts: int = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+    jobs_result_ttl_hours: float = float(os.getenv("JOBS_RESULT_TTL_HOURS", "24"))
+
+    # Admission control and request deadlines
+    admission_control_enabled: bool = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+    admission_initial_limit: int = int(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+    admission_min_limit: int = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+    admission_max_limit: int = int(os.getenv("ADMISSION_MAX_LIMIT", "100"))
+    admission_auth_max_limit: int = int(os.getenv("ADMISSION_AUTH_MAX_LIMIT", "8"))
+    admission_latency_target_ms: int = int(os.getenv("ADMISSION_LATENCY_TARGET_MS", "500"))
+    admission_retry_after_seconds: int = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+    request_timeout_seconds: float = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "10"))
+    request_max_timeout_seconds: float = float(os.getenv("REQUEST_MAX_TIMEOUT_SECONDS", "30"))
+    request_min_timeout_seconds: float = float(os.getenv("REQUEST_MIN_TIMEOUT_SECONDS", "0.1"))
+
+    # Group commit: batch concurrent todo creates/updates into one transaction
+    group_commit_enabled: bool = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() == "true"
+    group_commit_window_ms: float = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+    group_commit_max_batch: int = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "64"))
+
+    # Archiving of todos completed more than ARCHIVE_AFTER_DAYS ago. Off by
+    # default: archived todos drop out of lists unless include_archived is set.
+    archive_enabled: bool = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    archive_after_days: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+    archive_batch_size: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+    archive_interval_seconds: float = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "300"))
+
+    # Idempotency-Key replay cache ("auto" uses Redis when reachable, else memory)
+    idempotency_backend: str = os.getenv("IDEMPOTENCY_BACKEND", "auto")
+    idempotency_ttl_seconds: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    idempotency_pending_ttl_seconds: int = int(os.getenv("IDEMPOTENCY_PENDING_TTL_SECONDS", "60"))
+    idempotency_wait_seconds: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+    idempotency_max_entries: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+    # Manual ordering: keys longer than this get the user's todos rebalanced
+    position_rebalance_length: int = int(os.getenv("POSITION_REBALANCE_LENGTH", "32"))
+
+    # Test mode: EXPLAIN every todo list query and fail on a full scan of todos
+    query_plan_guard: bool = os.getenv("QUERY_PLAN_GUARD", "false").lower() == "true"
+
+    # Per-worker cache of hot users' todo lists. Versions are per process, so
+    # with several API processes a list may be up to the TTL stale. A user is
+    # hot after WORKING_SET_MIN_READS list reads within one TTL.
+    working_set_enabled: bool = os.getenv("WORKING_SET_ENABLED", "false").lower() == "true"
+    working_set_max_bytes: int = int(os.getenv("WORKING_SET_MAX_BYTES", str(64 * 1024 * 1024)))
+    working_set_max_todos: int = int(os.getenv("WORKING_SET_MAX_TODOS", "10000"))
+    working_set_ttl_seconds: float = float(os.getenv("WORKING_SET_TTL_SECONDS", "5"))
+    working_set_min_reads: int = int(os.getenv("WORKING_SET_MIN_READS", "2"))
+
+    # Admin-only diagnostics under /debug (profiler, tracemalloc, loop lag)
+    debug_endpoints_enabled: bool = os.getenv("DEBUG_ENDPOINTS_ENABLED", "false").lower() == "true"
+    profiler_max_seconds: float = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+    loop_lag_interval_ms: float = float(os.getenv("LOOP_LAG_INTERVAL_MS", "50"))
+    loop_lag_threshold_ms: float = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "200"))
 
     class Config:
         env_file = ".env"
@@ -21,10 +97,25 @@ settings = Settings()
 engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if engine.dialect.name == "postgresql":
+    @event.listens_for(SessionLocal, "after_begin")
+    def apply_statement_timeout(session, transaction, connection):
+        # Bound every statement by what is left of the request's deadline so
+        # abandoned requests don't keep queries running
+        remaining = remaining_time()
+        if remaining is None:
+            return
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(int(remaining * 1000), 1)}")
+
 class Base(DeclarativeBase):
     pass
 
 def get_db():
+    # Requests that waited in the threadpool past their deadline are dropped
+    # before they touch the database
+    check_deadline()
     db = SessionLocal()
     try:
         yield db
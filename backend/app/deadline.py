@@ -0,0 +1,33 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Absolute time.monotonic() deadline of the current request, set by
+# AdmissionControlMiddleware. Context variables follow the request into
+# Starlette's threadpool, so sync dependencies and services can read it.
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    pass
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def check_deadline() -> None:
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+
+# SQLSTATE of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+def is_deadline_error(error: BaseException) -> bool:
+    """True for errors caused by a request's own deadline, not by the work itself."""
+    if isinstance(error, DeadlineExceeded):
+        return True
+    # SQLAlchemy wraps the driver's QueryCanceled in OperationalError.orig
+    return getattr(getattr(error, "orig", None), "pgcode", None) == QUERY_CANCELED
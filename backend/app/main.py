@@ -1,17 +1,39 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from .routers import auth, todos
+from .routers import auth, todos, jobs, debug
 from .database import Base, engine, get_db, settings
-from .models import user, todo  # Import models to register them
+from .models import user, todo, job  # Import models to register them
+from .services.jobs import worker_pool
+from .services.archive import archive_mover
+from .services.diagnostics import loop_monitor
 from .middleware import setup_middleware
-import redis
+from .metrics import metrics
+from .clients import get_redis, close_clients
 import time
 from datetime import datetime
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize application state on startup and clean up on shutdown."""
+    app.state.start_time = time.time()
+    if settings.db_bootstrap:
+        # Dev-only shortcut; real deployments run `alembic upgrade head`
+        Base.metadata.create_all(bind=engine)
+    worker_pool.start()
+    if settings.archive_enabled:
+        archive_mover.start()
+    if settings.debug_endpoints_enabled:
+        loop_monitor.start()
+    yield
+    if settings.debug_endpoints_enabled:
+        loop_monitor.stop()
+    await run_in_threadpool(archive_mover.stop)
+    await run_in_threadpool(worker_pool.stop)
+    close_clients()
 
 app = FastAPI(
     title="Todo API",
@@ -19,6 +41,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -36,6 +59,9 @@ setup_middleware(app)
 # Include routers
 app.include_router(auth.router)
 app.include_router(todos.router)
+app.include_router(jobs.router)
+if settings.debug_endpoints_enabled:
+    app.include_router(debug.router)
 
 @app.get("/")
 def read_root():
@@ -76,9 +102,8 @@ def detailed_health_check(db: Session = Depends(get_db)):
     # Redis health check (if configured)
     try:
         # Try to connect to Redis for rate limiting
-        r = redis.Redis(host='localhost', port=6379, decode_responses=True)
         start_time = time.time()
-        r.ping()
+        get_redis().ping()
         redis_response_time = time.time() - start_time
         health_status["checks"]["redis"] = {
             "status": "healthy",
@@ -99,12 +124,7 @@ def detailed_health_check(db: Session = Depends(get_db)):
     
     return health_status
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize application state on startup."""
-    app.state.start_time = time.time()
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up resources on shutdown."""
-    pass 
\ No newline at end of file
+@app.get("/metrics")
+def read_metrics():
+    """Process-local counters and timers (compression, caches, ...)."""
+    return metrics.snapshot()
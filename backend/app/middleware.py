@@ -3,10 +3,28 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import anyio
+import base64
+import hashlib
+import importlib.util
+import math
 import time
 import uuid
+import zlib
 import structlog
 from .database import settings
+from .metrics import metrics
+from .deadline import request_deadline, DeadlineExceeded
+from .services.auth import username_from_token
+from .services.idempotency import get_idempotency_store
+
+# Brotli is optional and only imported once a client actually asks for it;
+# without it we fall back to gzip.
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
 
 # Configure structured logging
 structlog.configure(
@@ -93,13 +111,591 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             )
             raise
 
+# Content types worth compressing. Images, archives and other binary payloads
+# are already compressed and only waste CPU.
+COMPRESSIBLE_CONTENT_TYPES = (
+    "application/json",
+    "text/",
+    "application/javascript",
+    "application/xml",
+)
+
+class _GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        # wbits=31 makes zlib emit a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush so every chunk of a streaming response reaches the client
+        # without waiting for the rest of the body
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+class _BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        import brotli
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+def _select_encoding(accept_encoding: str) -> str | None:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    if BROTLI_AVAILABLE and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+class CompressionMiddleware:
+    """Gzip/Brotli compression that works chunk by chunk on streaming responses."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        level: int = 6,
+        brotli_quality: int = 4,
+        content_types: tuple = COMPRESSIBLE_CONTENT_TYPES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.content_types = content_types
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = _select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def is_compressible(self, headers: Headers) -> bool:
+        # Byte ranges refer to the uncompressed representation
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(self.content_types)
+
+    def create_compressor(self, encoding: str):
+        if encoding == "br":
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.level)
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message: Message | None = None
+        self.compressor = None
+        self.passthrough = False
+        self.buffer = b""
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Hold the start message until the first body chunk tells us
+            # whether the response is worth compressing
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        if self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            # Buffer leading chunks until we know the body is large enough
+            # to be worth compressing. BaseHTTPMiddleware re-streams every
+            # response, so even small JSON bodies arrive with more_body set.
+            self.buffer += body
+            if more_body and len(self.buffer) < self.middleware.minimum_size:
+                return
+            body, self.buffer = self.buffer, b""
+
+            headers = Headers(raw=self.start_message["headers"])
+            too_small = not more_body and len(body) < self.middleware.minimum_size
+            if too_small or not self.middleware.is_compressible(headers):
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            self.compressor = self.middleware.create_compressor(self.encoding)
+            compressed = self._compress(body, more_body)
+
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(compressed))
+
+            await self._send(self.start_message)
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            return
+
+        compressed = self._compress(body, more_body)
+        await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        start = time.thread_time()
+        if more_body:
+            compressed = self.compressor.compress(body)
+        else:
+            compressed = self.compressor.finish(body)
+        cpu_time = time.thread_time() - start
+
+        metrics.observe(f"compression.{self.encoding}.cpu", cpu_time)
+        metrics.increment(f"compression.{self.encoding}.bytes_in", len(body))
+        metrics.increment(f"compression.{self.encoding}.bytes_out", len(compressed))
+        if not more_body:
+            metrics.increment(f"compression.{self.encoding}.responses")
+        return compressed
+
+class AIMDLimiter:
+    """Concurrency limit adjusted by additive increase / multiplicative decrease.
+
+    Every fast, successful request raises the limit by roughly one per
+    window of `limit` requests; a slow, timed-out or overloaded request cuts
+    it by `backoff`. Only touched from the event loop, so no locking.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        backoff: float = 0.9,
+    ):
+        self.name = name
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.inflight = 0
+
+    def try_acquire(self) -> bool:
+        if self.inflight >= int(self.limit):
+            metrics.increment(f"admission.{self.name}.rejected")
+            return False
+        self.inflight += 1
+        metrics.set_gauge(f"admission.{self.name}.inflight", self.inflight)
+        return True
+
+    def release(self, latency: float, overloaded: bool, measured: bool = True) -> None:
+        """Free a slot; unless `measured` is False, adjust the limit from the outcome."""
+        self.inflight -= 1
+        if measured:
+            if overloaded or latency > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        metrics.set_gauge(f"admission.{self.name}.inflight", self.inflight)
+        metrics.set_gauge(f"admission.{self.name}.limit", round(self.limit, 2))
+
+# Paths that bypass admission control so probes, diagnostics and docs keep
+# working under load (profiles also run longer than the request deadline)
+ADMISSION_EXEMPT_PATHS = ("/health", "/metrics", "/debug", "/docs", "/redoc", "/openapi.json")
+
+class AdmissionControlMiddleware:
+    """Per-route-class concurrency limits, load shedding and request deadlines.
+
+    Each route class gets its own limiter, so a login storm on /auth (bcrypt
+    is CPU heavy) can't use up the capacity /todos needs. Over-limit requests
+    get an immediate 503 with Retry-After instead of queueing. Admitted
+    requests get a deadline from X-Request-Timeout (clamped to
+    [min_timeout, max_timeout]) or the default timeout; it is exposed
+    through `request_deadline` for DB statement timeouts and the request is
+    cancelled with a 503 once it expires. A 503/504 under a deadline the
+    client shortened says nothing about server load, so it doesn't shrink
+    the limit.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiters: dict,
+        default_timeout: float = 10,
+        max_timeout: float = 30,
+        retry_after: int = 1,
+        min_timeout: float = 0.1,
+    ):
+        self.app = app
+        self.limiters = limiters
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.retry_after = retry_after
+
+    def route_class(self, path: str) -> str:
+        return "auth" if path.startswith("/auth") else "api"
+
+    def timeout_for(self, headers: Headers) -> float:
+        requested = headers.get("x-request-timeout")
+        if requested:
+            try:
+                value = float(requested)
+            except ValueError:
+                value = math.nan
+            if math.isfinite(value):
+                return min(max(value, self.min_timeout), self.max_timeout)
+        return self.default_timeout
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path == "/" or path.startswith(ADMISSION_EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[self.route_class(path)]
+        if not limiter.try_acquire():
+            await self._reject(scope, receive, send, "Server is over capacity, retry later")
+            return
+
+        timeout = self.timeout_for(Headers(scope=scope))
+        start = time.monotonic()
+        token = request_deadline.set(start + timeout)
+        response_started = False
+        status_code = 500
+        latency = None
+
+        try:
+            with anyio.fail_after(timeout) as deadline_scope:
+
+                async def send_wrapper(message: Message):
+                    nonlocal response_started, status_code, latency
+                    if message["type"] == "http.response.start":
+                        response_started = True
+                        status_code = message["status"]
+                        # The deadline and the latency signal cover producing
+                        # the response; streamed bodies (exports, job
+                        # downloads) may take longer to send
+                        latency = time.monotonic() - start
+                        deadline_scope.deadline = math.inf
+                    await send(message)
+
+                await self.app(scope, receive, send_wrapper)
+        except (TimeoutError, DeadlineExceeded):
+            metrics.increment(f"admission.{limiter.name}.deadline_exceeded")
+            status_code = 503
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, "Request deadline exceeded")
+        finally:
+            request_deadline.reset(token)
+            if latency is None:
+                latency = time.monotonic() - start
+            overloaded = status_code in (503, 504)
+            client_deadline = timeout < self.default_timeout
+            limiter.release(latency, overloaded=overloaded, measured=not (overloaded and client_deadline))
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, detail: str):
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=503,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+        await response(scope, receive, send)
+
+async def _deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(settings.admission_retry_after_seconds)},
+    )
+
+def setup_admission_control(app: FastAPI):
+    latency_target = settings.admission_latency_target_ms / 1000
+    limiters = {
+        "api": AIMDLimiter(
+            "api",
+            settings.admission_initial_limit,
+            settings.admission_min_limit,
+            settings.admission_max_limit,
+            latency_target,
+        ),
+        "auth": AIMDLimiter(
+            "auth",
+            min(settings.admission_initial_limit, settings.admission_auth_max_limit),
+            settings.admission_min_limit,
+            settings.admission_auth_max_limit,
+            latency_target,
+        ),
+    }
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        limiters=limiters,
+        default_timeout=settings.request_timeout_seconds,
+        max_timeout=settings.request_max_timeout_seconds,
+        retry_after=settings.admission_retry_after_seconds,
+        min_timeout=settings.request_min_timeout_seconds,
+    )
+
+IDEMPOTENT_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+IDEMPOTENT_PATH_PREFIXES = ("/todos", "/auth")
+# Login responses carry tokens; never keep them around for replay
+IDEMPOTENCY_EXCLUDED_PATHS = ("/auth/token",)
+# Rejections from the rate limiter, auth and this middleware mean the
+# handler never ran, so a retry with the same key must run it
+UNSTORED_STATUSES = (401, 403, 409, 429)
+
+class IdempotencyMiddleware:
+    """Replay responses for retried writes that carry an Idempotency-Key.
+
+    Keys are scoped to the caller: the authenticated username, so a retry
+    after a token refresh still matches, or the client address for
+    anonymous requests. Requests with an invalid token pass straight
+    through to be rejected. The first request for a key runs and its
+    response is stored; retries with the same method, path and body get
+    the stored response back with `Idempotent-Replayed: true`, and
+    concurrent duplicates wait for the first request to finish instead of
+    running again. Reusing a key for a different request is a 422. 5xx
+    responses and rejections (401, 403, 409, 429) aren't stored, so the
+    client can retry them. If the store fails the request runs without
+    deduplication rather than failing.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        ttl: float = 86400,
+        pending_ttl: float = 60,
+        wait_timeout: float = 10,
+        poll_interval: float = 0.05,
+    ):
+        self.app = app
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in IDEMPOTENT_METHODS
+            or not scope["path"].startswith(IDEMPOTENT_PATH_PREFIXES)
+            or scope["path"] in IDEMPOTENCY_EXCLUDED_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not 0 < len(idempotency_key) <= 255:
+            await JSONResponse({"detail": "Invalid Idempotency-Key"}, status_code=400)(scope, receive, send)
+            return
+
+        caller = self._caller(scope, headers)
+        if caller is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        key = hashlib.sha256(f"{caller}\n{idempotency_key}".encode()).hexdigest()
+        fingerprint = hashlib.sha256(
+            b"\n".join([scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body])
+        ).hexdigest()
+
+        try:
+            store = get_idempotency_store()
+            record = await run_in_threadpool(store.begin, key, fingerprint, self.pending_ttl)
+        except Exception as e:
+            metrics.increment("idempotency.store_errors")
+            logger.warning("Idempotency store unavailable; running request without deduplication", error=str(e))
+            await self.app(scope, _replaying(body, receive), send)
+            return
+        if record is None:
+            await self._run_and_store(scope, body, receive, send, store, key, fingerprint)
+            return
+
+        if record["state"] == "pending":
+            record = await self._wait_for(store, key)
+            if record is None:
+                await JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is still in progress"},
+                    status_code=409,
+                    headers={"Retry-After": "1"},
+                )(scope, receive, send)
+                return
+
+        if record["fingerprint"] != fingerprint:
+            await JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"},
+                status_code=422,
+            )(scope, receive, send)
+            return
+
+        metrics.increment("idempotency.replayed")
+        response = Response(
+            content=base64.b64decode(record["body"]),
+            status_code=record["status"],
+        )
+        response.raw_headers = [
+            (name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]
+        ] + [(b"idempotent-replayed", b"true")]
+        await response(scope, receive, send)
+
+    def _caller(self, scope: Scope, headers: Headers):
+        authorization = headers.get("authorization")
+        if authorization is None:
+            return f"client:{(scope.get('client') or ('anonymous',))[0]}"
+        scheme, _, token = authorization.partition(" ")
+        username = username_from_token(token) if scheme.lower() == "bearer" else None
+        return None if username is None else f"user:{username}"
+
+    async def _read_body(self, receive: Receive) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    async def _wait_for(self, store, key: str):
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await anyio.sleep(self.poll_interval)
+            try:
+                record = await run_in_threadpool(store.get, key)
+            except Exception as e:
+                logger.warning("Idempotency store unavailable", error=str(e))
+                return None
+            if record is None or record["state"] == "done":
+                return record
+        return None
+
+    async def _run_and_store(
+        self, scope: Scope, body: bytes, receive: Receive, send: Send, store, key: str, fingerprint: str
+    ):
+        start_message = None
+        chunks = []
+
+        async def capture_send(message: Message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, _replaying(body, receive), capture_send)
+        except BaseException:
+            await self._store_call(store.release, key)
+            raise
+
+        status = None if start_message is None else start_message["status"]
+        if status is None or status >= 500 or status in UNSTORED_STATUSES:
+            await self._store_call(store.release, key)
+            return
+
+        record = {
+            "state": "done",
+            "fingerprint": fingerprint,
+            "status": status,
+            "headers": [
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in start_message.get("headers", [])
+            ],
+            "body": base64.b64encode(b"".join(chunks)).decode(),
+        }
+        metrics.increment("idempotency.stored")
+        await self._store_call(store.complete, key, record, self.ttl)
+
+    async def _store_call(self, fn, *args) -> None:
+        # The response has been sent; a store failure only costs deduplication
+        # (the pending claim expires after pending_ttl)
+        try:
+            await run_in_threadpool(fn, *args)
+        except Exception as e:
+            metrics.increment("idempotency.store_errors")
+            logger.warning("Idempotency store unavailable", error=str(e))
+
+def _replaying(body: bytes, receive: Receive) -> Receive:
+    """A receive that yields the already-read body, then defers to `receive`."""
+    replayed = False
+
+    async def replay_receive() -> Message:
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The body is consumed; further receives wait for the real disconnect
+        return await receive()
+
+    return replay_receive
+
 def setup_middleware(app: FastAPI):
     # Add rate limiting
     app.state.limiter = limiter
     app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_exception_handler(DeadlineExceeded, _deadline_exceeded_handler)
     
     # Add security headers
     app.add_middleware(SecurityHeadersMiddleware)
-    
+
+    # Add Idempotency-Key replay for write endpoints
+    app.add_middleware(
+        IdempotencyMiddleware,
+        ttl=settings.idempotency_ttl_seconds,
+        pending_ttl=settings.idempotency_pending_ttl_seconds,
+        wait_timeout=settings.idempotency_wait_seconds,
+    )
+
+    # Add response compression
+    if settings.compression_enabled:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression_minimum_size,
+            level=settings.compression_level,
+            brotli_quality=settings.brotli_quality,
+        )
+
+    # Add admission control and request deadlines
+    if settings.admission_control_enabled:
+        setup_admission_control(app)
+
     # Add logging
-    app.add_middleware(LoggingMiddleware) 
\ No newline at end of file
+    app.add_middleware(LoggingMiddleware)
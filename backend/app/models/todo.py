@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
+# Order keys compare bytewise; PostgreSQL's default collation is locale-aware
+OrderKey = String().with_variant(String(collation="C"), "postgresql")
+
 class Todo(Base):
     __tablename__ = "todos"
 
@@ -12,6 +15,43 @@ class Todo(Base):
     completed = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # Manual order key (app/services/ordering.py); NULL until first positioned
+    position = Column(OrderKey, nullable=True)
+
+    user = relationship("User", back_populates="todos")
+
+    # Identify rows by (user_id, id) -- the partitioned table's primary key --
+    # so ORM UPDATEs and DELETEs carry the partition key and touch one partition
+    __mapper_args__ = {"primary_key": [user_id, id]}
+
+    __table_args__ = (
+        # Lets the archive mover find old completed todos without a full scan
+        Index(
+            "ix_todos_archive_candidates",
+            func.coalesce(updated_at, created_at),
+            postgresql_where=completed,
+            sqlite_where=completed,
+        ),
+        # One per whitelisted sort key (app/services/query.py SORT_KEYS)
+        Index("ix_todos_user_id_position", user_id, position),
+        Index("ix_todos_user_id_created_at", user_id, created_at),
+        Index("ix_todos_user_id_updated_at", user_id, updated_at),
+        Index("ix_todos_user_id_title", user_id, title),
+        Index("ix_todos_user_id_completed", user_id, completed),
+        Index("ix_todos_user_id_id", user_id, id),
+    )
 
-    user = relationship("User", back_populates="todos") 
\ No newline at end of file
+class ArchivedTodo(Base):
+    """Cold storage for todos completed long ago; same columns as Todo."""
+    __tablename__ = "todos_archive"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    description = Column(String, nullable=True)
+    completed = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    position = Column(OrderKey, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
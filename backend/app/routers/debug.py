@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from ..database import settings
+from ..models.user import User
+from ..services.auth import get_current_active_user
+from ..services.diagnostics import ProfilerBusy, collapse, loop_monitor, memory_tracker, stack_sampler
+
+def require_admin(current_user: User = Depends(get_current_active_user)) -> User:
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+# Only included by app.main when DEBUG_ENDPOINTS_ENABLED is set
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"],
+    dependencies=[Depends(require_admin)],
+)
+
+@router.get("/profile", response_class=PlainTextResponse)
+def profile(
+    seconds: float = Query(5, gt=0, le=settings.profiler_max_seconds, description="How long to sample"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="Sampling interval"),
+    idle: bool = Query(False, description="Include threads parked waiting for work"),
+):
+    """Sample all thread stacks and return them as collapsed stacks (flamegraph input)"""
+    try:
+        counts = stack_sampler.sample(seconds, interval_ms / 1000, idle=idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return collapse(counts)
+
+@router.post("/memory/start")
+def start_memory_tracing(frames: int = Query(10, ge=1, le=100, description="Frames kept per allocation")):
+    """Start tracemalloc; later reports are diffed against this point"""
+    memory_tracker.start(frames)
+    return {"tracing": True}
+
+@router.get("/memory")
+def memory_report(
+    top: int = Query(25, ge=1, le=500),
+    group_by: str = Query("lineno", regex="^(lineno|filename|traceback)$"),
+):
+    """Top allocation sites, and growth since tracing started"""
+    return memory_tracker.report(top, group_by=group_by)
+
+@router.post("/memory/stop")
+def stop_memory_tracing():
+    memory_tracker.stop()
+    return {"tracing": False}
+
+@router.get("/loop")
+def event_loop_report():
+    """Event-loop lag and the stacks of recent calls that blocked it"""
+    return loop_monitor.report()
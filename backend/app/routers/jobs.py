@@ -0,0 +1,134 @@
+import os
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models.user import User
+from ..schemas.job import JobCreate, JobResponse
+from ..services.auth import get_current_active_user
+from ..services.jobs import JobLimitExceeded, submit_job, get_job, get_jobs
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    dependencies=[Depends(get_current_active_user)],
+)
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=start-end` range into inclusive offsets.
+
+    Returns None when the range can't be satisfied for a file of `size` bytes.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return None
+            start = max(size - length, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+def iter_file(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+@router.post("/", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+def create_job(
+    job: JobCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        return submit_job(db, user_id=current_user.id, kind=job.kind, params=job.params)
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@router.get("/", response_model=List[JobResponse])
+def read_jobs(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    return get_jobs(db, user_id=current_user.id, skip=skip, limit=limit)
+
+@router.get("/{job_id}", response_model=JobResponse)
+def read_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    job = get_job(db, job_id=job_id, user_id=current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}/result")
+def download_job_result(
+    job_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Download a finished job's artifact. Supports single `Range` requests."""
+    job = get_job(db, job_id=job_id, user_id=current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "succeeded" or not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=409, detail=f"Job result not available (status: {job.status})")
+
+    size = os.path.getsize(job.result_path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename=job-{job.id}",
+    }
+
+    range_header = request.headers.get("range")
+    if range_header is None or size == 0:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            iter_file(job.result_path, 0, size - 1),
+            media_type=job.result_media_type,
+            headers=headers
+        )
+
+    byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(job.result_path, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=job.result_media_type,
+        headers=headers
+    )
@@ -2,13 +2,10 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import datetime
-import json
-import io
 from ..database import get_db
 from ..models.user import User
 from ..models.todo import Todo
-from ..schemas.todo import TodoCreate, TodoUpdate, TodoResponse
+from ..schemas.todo import TodoCreate, TodoUpdate, TodoResponse, TodoMove
 from pydantic import BaseModel
 
 class TodosResponse(BaseModel):
@@ -17,7 +14,17 @@ class TodosResponse(BaseModel):
     skip: int
     limit: int
 from ..services.auth import get_current_active_user
-from ..services.todo import get_todos, get_todo, create_todo, update_todo, delete_todo, search_todos
+from ..services.todo import get_todos, get_todo, create_todo, update_todo, delete_todo, move_todo, read_todos_page, read_todo_analytics
+from ..services.query import InvalidQuery, SORT_KEYS
+from ..services.ordering import InvalidMove, needs_rebalance
+from ..services.jobs import request_rebalance
+from ..services.export import iter_export, EXPORT_MEDIA_TYPES
+
+FILTER_HELP = 'Filter expression, e.g. completed:false AND (created>=2024-01-01 OR "milk")'
+SORT_HELP = f"Sort by field: {', '.join(SORT_KEYS)}"
+
+# Larger exports go through POST /jobs
+EXPORT_LIMIT = 1000
 
 router = APIRouter(
     prefix="/todos",
@@ -31,51 +38,32 @@ def read_todos(
     limit: int = Query(10, ge=1, le=100, description="Number of todos to return"),
     search: Optional[str] = Query(None, description="Search in title and description"),
     completed: Optional[bool] = Query(None, description="Filter by completion status"),
-    sort_by: str = Query("created_at", description="Sort by field"),
+    filter_text: Optional[str] = Query(None, alias="filter", description=FILTER_HELP),
+    sort_by: str = Query("created_at", description=SORT_HELP),
     sort_order: str = Query("desc", regex="^(asc|desc)$", description="Sort order"),
+    include_archived: bool = Query(False, description="Include archived todos"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    # Get total count for pagination
-    total_query = db.query(Todo).filter(Todo.user_id == current_user.id)
-    
-    if search:
-        total_query = total_query.filter(
-            (Todo.title.ilike(f"%{search}%")) | 
-            (Todo.description.ilike(f"%{search}%"))
-        )
-    
-    if completed is not None:
-        total_query = total_query.filter(Todo.completed == completed)
-    
-    total = total_query.count()
-    
-    # Get paginated todos
-    if search:
-        todos = search_todos(
-            db, 
-            user_id=current_user.id, 
+    try:
+        page = read_todos_page(
+            db,
+            user_id=current_user.id,
             search=search,
             completed=completed,
-            skip=skip, 
+            skip=skip,
             limit=limit,
             sort_by=sort_by,
-            sort_order=sort_order
+            sort_order=sort_order,
+            include_archived=include_archived,
+            filter_text=filter_text
         )
-    else:
-        todos = get_todos(
-            db, 
-            user_id=current_user.id, 
-            completed=completed,
-            skip=skip, 
-            limit=limit,
-            sort_by=sort_by,
-            sort_order=sort_order
-        )
-    
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     return TodosResponse(
-        todos=[TodoResponse.model_validate(todo) for todo in todos],
-        total=total,
+        todos=page["todos"],
+        total=page["total"],
         skip=skip,
         limit=limit
     )
@@ -94,20 +82,7 @@ def get_todo_analytics(
     db: Session = Depends(get_db)
 ):
     """Get todo analytics for the current user"""
-    total_todos = db.query(Todo).filter(Todo.user_id == current_user.id).count()
-    completed_todos = db.query(Todo).filter(
-        Todo.user_id == current_user.id, 
-        Todo.completed == True
-    ).count()
-    pending_todos = total_todos - completed_todos
-    completion_rate = (completed_todos / total_todos * 100) if total_todos > 0 else 0
-    
-    return {
-        "total_todos": total_todos,
-        "completed_todos": completed_todos,
-        "pending_todos": pending_todos,
-        "completion_rate": round(completion_rate, 2)
-    }
+    return read_todo_analytics(db, user_id=current_user.id)
 
 @router.get("/{todo_id}", response_model=TodoResponse)
 def read_todo(
@@ -115,7 +90,7 @@ def read_todo(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    db_todo = get_todo(db, todo_id=todo_id, user_id=current_user.id)
+    db_todo = get_todo(db, todo_id=todo_id, user_id=current_user.id, include_archived=True)
     if db_todo is None:
         raise HTTPException(status_code=404, detail="Todo not found")
     return db_todo
@@ -132,6 +107,27 @@ def update_existing_todo(
         raise HTTPException(status_code=404, detail="Todo not found")
     return db_todo
 
+@router.patch("/{todo_id}/move", response_model=TodoResponse)
+def move_existing_todo(
+    todo_id: int,
+    move: TodoMove,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Reorder a todo relative to its new neighbours (use sort_by=position to read the order)"""
+    try:
+        db_todo = move_todo(
+            db, todo_id=todo_id, user_id=current_user.id,
+            after_id=move.after_id, before_id=move.before_id
+        )
+    except InvalidMove as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if db_todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    if needs_rebalance(db_todo.position):
+        request_rebalance(db, user_id=current_user.id)
+    return db_todo
+
 @router.delete("/{todo_id}")
 def delete_existing_todo(
     todo_id: int,
@@ -147,81 +143,36 @@ def export_todos(
     format: str,
     search: Optional[str] = Query(None, description="Search in title and description"),
     completed: Optional[bool] = Query(None, description="Filter by completion status"),
-    sort_by: str = Query("created_at", description="Sort by field"),
+    filter_text: Optional[str] = Query(None, alias="filter", description=FILTER_HELP),
+    sort_by: str = Query("created_at", description=SORT_HELP),
     sort_order: str = Query("desc", regex="^(asc|desc)$", description="Sort order"),
+    include_archived: bool = Query(False, description="Include archived todos"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Export todos for the current user with optional filtering"""
     # Validate format
-    if format not in ["json", "csv"]:
+    if format not in EXPORT_MEDIA_TYPES:
         raise HTTPException(status_code=400, detail="Invalid format. Use 'json' or 'csv'.")
     
-    # Get filtered todos
-    if search:
-        todos = search_todos(
-            db, 
-            user_id=current_user.id, 
-            search=search,
-            completed=completed,
-            skip=0, 
-            limit=1000,  # Export limit
-            sort_by=sort_by,
-            sort_order=sort_order
-        )
-    else:
+    try:
         todos = get_todos(
-            db, 
-            user_id=current_user.id, 
+            db,
+            user_id=current_user.id,
+            search=search,
             completed=completed,
-            skip=0, 
-            limit=1000,  # Export limit
+            skip=0,
+            limit=EXPORT_LIMIT,
             sort_by=sort_by,
-            sort_order=sort_order
-        )
-    
-    if format == "json":
-        todos_data = [TodoResponse.model_validate(todo).model_dump() for todo in todos]
-        # Convert datetime objects to ISO format strings for JSON serialization
-        for todo in todos_data:
-            todo['created_at'] = todo['created_at'].isoformat() if isinstance(todo['created_at'], datetime) else todo['created_at']
-            if todo['updated_at']:
-                todo['updated_at'] = todo['updated_at'].isoformat() if isinstance(todo['updated_at'], datetime) else todo['updated_at']
-        
-        json_str = json.dumps(todos_data, indent=2)
-        buffer = io.StringIO(json_str)
-        
-        return StreamingResponse(
-            io.BytesIO(buffer.getvalue().encode()),
-            media_type="application/json",
-            headers={"Content-Disposition": "attachment; filename=todos.json"}
+            sort_order=sort_order,
+            include_archived=include_archived,
+            filter_text=filter_text
         )
-    
-    elif format == "csv":
-        import csv
-        csv_buffer = io.StringIO()
-        writer = csv.writer(csv_buffer)
-        
-        # Write header
-        writer.writerow(["ID", "Title", "Description", "Completed", "Created At", "Updated At"])
-        
-        # Write data
-        for todo in todos:
-            todo_data = TodoResponse.model_validate(todo).model_dump()
-            writer.writerow([
-                todo_data['id'],
-                todo_data['title'],
-                todo_data['description'] or '',
-                todo_data['completed'],
-                todo_data['created_at'].isoformat() if isinstance(todo_data['created_at'], datetime) else todo_data['created_at'],
-                todo_data['updated_at'].isoformat() if todo_data['updated_at'] and isinstance(todo_data['updated_at'], datetime) else (todo_data['updated_at'] or '')
-            ])
-        
-        csv_content = csv_buffer.getvalue()
-        csv_buffer.close()
-        
-        return StreamingResponse(
-            io.BytesIO(csv_content.encode()),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=todos.csv"}
-        ) 
\ No newline at end of file
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        iter_export(format, todos),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=todos.{format}"}
+    )
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field, ConfigDict
+from datetime import datetime
+from typing import Any, Dict, Literal, Optional
+
+class JobCreate(BaseModel):
+    kind: Literal["export", "analytics"] = Field(..., description="Type of job to run")
+    params: Dict[str, Any] = Field(default_factory=dict, description="Job parameters")
+
+class JobResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    kind: str
+    params: Dict[str, Any]
+    status: str
+    error: Optional[str] = None
+    result_size: Optional[int] = None
+    result_media_type: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
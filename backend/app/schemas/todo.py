@@ -35,4 +35,9 @@ class TodoResponse(TodoBase):
     id: int
     user_id: int
     created_at: datetime
-    updated_at: Optional[datetime] = None 
\ No newline at end of file
+    updated_at: Optional[datetime] = None
+    position: Optional[str] = None
+
+class TodoMove(BaseModel):
+    after_id: Optional[int] = Field(None, description="Place the todo directly after this todo")
+    before_id: Optional[int] = Field(None, description="Place the todo directly before this todo") 
\ No newline at end of file
@@ -0,0 +1,152 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+import structlog
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.orm import Session, aliased
+from ..database import SessionLocal, settings
+from ..metrics import metrics
+from ..models.todo import Todo, ArchivedTodo
+from .versions import bump_write_version
+
+logger = structlog.get_logger()
+
+todos_table = Todo.__table__
+archive_table = ArchivedTodo.__table__
+TODO_COLUMNS = [column.name for column in todos_table.c]
+
+def todos_with_archive():
+    """A Todo entity over the union of the hot and archive tables."""
+    hot = select(*todos_table.c)
+    cold = select(*[archive_table.c[name] for name in TODO_COLUMNS])
+    return aliased(Todo, union_all(hot, cold).subquery("todos_all"))
+
+def count_archived_todos(db: Session, user_id: int) -> int:
+    return db.query(func.count(ArchivedTodo.id)).filter(ArchivedTodo.user_id == user_id).scalar()
+
+def get_archived_todo(db: Session, todo_id: int, user_id: int) -> Optional[ArchivedTodo]:
+    return db.query(ArchivedTodo).filter(ArchivedTodo.id == todo_id, ArchivedTodo.user_id == user_id).first()
+
+def unarchive_todo(db: Session, todo_id: int, user_id: int) -> Optional[Todo]:
+    """Move an archived todo back into the hot table. The caller commits."""
+    row = db.execute(
+        select(archive_table)
+        .where(archive_table.c.id == todo_id, archive_table.c.user_id == user_id)
+        .with_for_update()
+    ).first()
+    if row is None:
+        return None
+    db.execute(insert(todos_table).values({name: row._mapping[name] for name in TODO_COLUMNS}))
+    db.execute(delete(archive_table).where(archive_table.c.id == todo_id))
+    metrics.increment("archive.unarchived")
+    return db.get(Todo, (user_id, todo_id))
+
+def delete_archived_todo(db: Session, todo_id: int, user_id: int) -> bool:
+    result = db.execute(
+        delete(archive_table).where(archive_table.c.id == todo_id, archive_table.c.user_id == user_id)
+    )
+    return result.rowcount > 0
+
+def archive_completed_todos(db: Session, older_than_days: int, batch_size: int) -> int:
+    """Move one batch of todos completed before the cutoff to the archive.
+
+    Todos have no completion timestamp; the last update (or creation) time of
+    a completed todo stands in for it. Returns the number of rows moved.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    candidates = (
+        select(todos_table.c.id, todos_table.c.user_id)
+        .where(
+            todos_table.c.completed == True,
+            func.coalesce(todos_table.c.updated_at, todos_table.c.created_at) < cutoff,
+        )
+        .limit(batch_size)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        # Several API workers may run the mover; never block user writes
+        candidates = candidates.with_for_update(skip_locked=True)
+
+    rows = db.execute(candidates).all()
+    if not rows:
+        db.rollback()
+        return 0
+
+    ids = [row.id for row in rows]
+    user_ids = {row.user_id for row in rows}
+    # The user_id predicate limits the statements to the batch's partitions
+    batch = (todos_table.c.user_id.in_(user_ids), todos_table.c.id.in_(ids))
+    db.execute(
+        insert(archive_table).from_select(
+            TODO_COLUMNS, select(*todos_table.c).where(*batch)
+        )
+    )
+    db.execute(delete(todos_table).where(*batch))
+    db.commit()
+
+    for user_id in user_ids:
+        bump_write_version(user_id)
+    metrics.increment("archive.moved", len(ids))
+    return len(ids)
+
+class ArchiveMover:
+    """Background thread that moves old completed todos in small batches."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        older_than_days: int,
+        batch_size: int,
+        interval: float,
+        batch_pause: float = 0.1,
+    ):
+        self.session_factory = session_factory
+        self.older_than_days = older_than_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="archive-mover", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> int:
+        """Move batches until no candidates are left. Returns rows moved."""
+        moved = 0
+        while not self._stopping.is_set():
+            db = self.session_factory()
+            try:
+                count = archive_completed_todos(db, self.older_than_days, self.batch_size)
+            finally:
+                db.close()
+            moved += count
+            if count < self.batch_size:
+                break
+            # Short pause between batches keeps lock time and IO bursts small
+            self._stopping.wait(self.batch_pause)
+        return moved
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                moved = self.run_once()
+                if moved:
+                    logger.info("Archived completed todos", count=moved)
+            except Exception as e:
+                logger.error("Archive mover error", error=str(e), exc_info=True)
+            self._stopping.wait(self.interval)
+
+archive_mover = ArchiveMover(
+    SessionLocal,
+    older_than_days=settings.archive_after_days,
+    batch_size=settings.archive_batch_size,
+    interval=settings.archive_interval_seconds,
+)
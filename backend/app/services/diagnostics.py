@@ -0,0 +1,219 @@
+import asyncio
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import structlog
+from ..database import settings
+from ..metrics import metrics
+
+logger = structlog.get_logger()
+
+class ProfilerBusy(Exception):
+    pass
+
+def _frame_stack(frame) -> List[str]:
+    """Root-first list of `function (file:line)` entries."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+class StackSampler:
+    """Statistical CPU profiler over sys._current_frames().
+
+    Every `interval` seconds it records the current stack of every thread
+    except its own, so the cost is one frame walk per thread per sample and
+    nothing when idle. Output is in the collapsed format flamegraph.pl and
+    speedscope read: `thread;outer;...;inner count` per line.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, interval: float, idle: bool = False) -> Dict[str, int]:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already being taken")
+        try:
+            return self._sample(seconds, interval, idle)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float, idle: bool) -> Dict[str, int]:
+        own_id = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _frame_stack(frame)
+                if not idle and _is_idle(stack):
+                    continue
+                name = names.get(thread_id, str(thread_id))
+                counts[";".join([name] + stack)] += 1
+            time.sleep(interval)
+        metrics.increment("diagnostics.profiles")
+        return dict(counts)
+
+# Innermost frames of threads parked waiting for work; skipped by default so
+# the profile shows where CPU goes rather than idle pool threads
+IDLE_FUNCTIONS = ("wait", "select", "poll", "_worker", "accept", "sleep", "get")
+
+def _is_idle(stack: List[str]) -> bool:
+    return bool(stack) and stack[-1].split(" ", 1)[0] in IDLE_FUNCTIONS
+
+def collapse(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+class MemoryTracker:
+    """tracemalloc snapshots, diffed against the one taken when tracing began."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames: int) -> None:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._baseline = self._take()
+
+    def stop(self) -> None:
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+
+    def report(self, top: int, group_by: str = "lineno") -> dict:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return {"tracing": False}
+            snapshot = self._take()
+            current, peak = tracemalloc.get_traced_memory()
+            report = {
+                "tracing": True,
+                "traced_bytes": current,
+                "peak_bytes": peak,
+                "top": [_stat(stat) for stat in snapshot.statistics(group_by)[:top]],
+            }
+            if self._baseline is not None:
+                diff = snapshot.compare_to(self._baseline, group_by)
+                report["growth_since_start"] = [_stat(stat) for stat in diff[:top]]
+            return report
+
+    def _take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+def _stat(stat) -> dict:
+    entry = {
+        "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size_bytes": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_bytes"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+class LoopLagMonitor:
+    """Detect code that blocks the event loop.
+
+    A heartbeat task on the loop wakes every `interval` seconds and records
+    how late it woke (event_loop.lag timer). A watchdog thread checks the
+    heartbeat; once it is more than `threshold` seconds stale the loop is
+    blocked, so it captures the loop thread's stack right then -- that stack
+    is the blocking call, e.g. a sync DB query inside an `async def`
+    dependency. The last `history` stalls are kept for /debug/loop.
+    """
+
+    def __init__(self, interval: float, threshold: float, history: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.events: deque = deque(maxlen=history)
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._stall: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Call from the event loop thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Call from the event loop thread."""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(self.interval * 2)
+            self._thread = None
+
+    def report(self) -> dict:
+        with self._lock:
+            events = [
+                {key: value for key, value in event.items() if not key.startswith("_")}
+                for event in self.events
+            ]
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag": metrics.snapshot()["timers"].get("event_loop.lag"),
+            "blocking_events": events,
+        }
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            metrics.observe("event_loop.lag", max(now - expected, 0.0))
+            with self._lock:
+                self._last_beat = now
+                if self._stall is not None:
+                    # The loop is running again; record how long it was stuck
+                    self._stall["blocked_ms"] = round((now - self._stall.pop("_since")) * 1000, 1)
+                    self._stall = None
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(self.interval):
+            with self._lock:
+                stale = time.monotonic() - self._last_beat
+                if stale < self.threshold or self._stall is not None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                self._stall = {
+                    "detected_at": datetime.now(timezone.utc).isoformat(),
+                    "blocked_ms": None,
+                    "stack": _frame_stack(frame) if frame is not None else [],
+                    "_since": self._last_beat,
+                }
+                self.events.append(self._stall)
+            metrics.increment("event_loop.blocked")
+            logger.warning("Event loop blocked", blocked_ms=round(stale * 1000, 1))
+
+stack_sampler = StackSampler()
+memory_tracker = MemoryTracker()
+loop_monitor = LoopLagMonitor(
+    interval=settings.loop_lag_interval_ms / 1000,
+    threshold=settings.loop_lag_threshold_ms / 1000,
+)
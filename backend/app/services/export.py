@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator
+from ..models.todo import Todo
+from ..schemas.todo import TodoResponse
+
+CSV_HEADER = ["ID", "Title", "Description", "Completed", "Created At", "Updated At"]
+
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv",
+}
+
+# Rows serialized per yielded chunk. Larger chunks compress better, smaller
+# ones get the first bytes to the client sooner.
+EXPORT_CHUNK_ROWS = 200
+
+def iter_json_export(todos: Iterable[Todo]) -> Iterator[bytes]:
+    """Yield a compact JSON array of todos in chunks."""
+    yield b"["
+    parts = []
+    first = True
+    for todo in todos:
+        data = TodoResponse.model_validate(todo).model_dump(mode="json")
+        parts.append(("" if first else ",") + json.dumps(data, separators=(",", ":")))
+        first = False
+        if len(parts) >= EXPORT_CHUNK_ROWS:
+            yield "".join(parts).encode()
+            parts = []
+    if parts:
+        yield "".join(parts).encode()
+    yield b"]"
+
+def iter_csv_export(todos: Iterable[Todo]) -> Iterator[bytes]:
+    """Yield CSV rows of todos in chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    rows = 0
+    for todo in todos:
+        writer.writerow([
+            todo.id,
+            todo.title,
+            todo.description or '',
+            todo.completed,
+            todo.created_at.isoformat() if todo.created_at else '',
+            todo.updated_at.isoformat() if todo.updated_at else '',
+        ])
+        rows += 1
+        if rows % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+def iter_export(format: str, todos: Iterable[Todo]) -> Iterator[bytes]:
+    if format == "json":
+        return iter_json_export(todos)
+    return iter_csv_export(todos)
@@ -0,0 +1,167 @@
+import threading
+from typing import Dict, List, Optional
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from ..deadline import DeadlineExceeded, remaining_time, request_deadline
+from ..metrics import metrics
+from ..models.todo import Todo
+from .ordering import keys_between, last_position
+
+todos_table = Todo.__table__
+
+class _PendingWrite:
+    __slots__ = ("kind", "user_id", "todo_id", "values", "done", "result", "error", "batch")
+
+    def __init__(self, kind: str, user_id: int, values: dict, todo_id: Optional[int] = None):
+        self.kind = kind
+        self.user_id = user_id
+        self.todo_id = todo_id
+        self.values = values
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.batch = None
+
+class _Batch:
+    __slots__ = ("writes", "full", "flushing")
+
+    def __init__(self):
+        self.writes: List[_PendingWrite] = []
+        self.full = threading.Event()
+        self.flushing = False
+
+class GroupCommitter:
+    """Collect concurrent todo writes and commit them in one transaction.
+
+    The first writer to arrive opens a batch and becomes its leader: it waits
+    up to `window` seconds (or until `max_batch` writes have joined), then
+    flushes the whole batch -- creates as one multi-row INSERT ... RETURNING,
+    updates as UPDATE ... RETURNING -- and commits once. The flush uses a
+    fresh session with no request deadline, since the batch holds other
+    requests' writes. Every caller blocks until the flush and gets back its
+    own row or its own exception; a follower gives up with DeadlineExceeded
+    once its own deadline passes. Creates get their position keys at flush
+    time, so todos created in the same batch get distinct keys at the end
+    of the list.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._open_batch: Optional[_Batch] = None
+
+    def create(self, db: Session, user_id: int, values: dict) -> Todo:
+        return self._submit(db, _PendingWrite("create", user_id, values))
+
+    def update(self, db: Session, todo_id: int, user_id: int, values: dict) -> Optional[Todo]:
+        return self._submit(db, _PendingWrite("update", user_id, values, todo_id=todo_id))
+
+    def _submit(self, db: Session, write: _PendingWrite):
+        with self._lock:
+            batch = self._open_batch
+            leader = batch is None
+            if leader:
+                batch = self._open_batch = _Batch()
+            batch.writes.append(write)
+            write.batch = batch
+            if len(batch.writes) >= self.max_batch:
+                # Close the batch; the next writer starts a new one
+                self._open_batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open_batch is batch:
+                    self._open_batch = None
+                batch.flushing = True
+            self._flush(db, batch.writes)
+        else:
+            # Wait no longer than this follower's own deadline; a slow or
+            # stuck flush must not hold it past the point its client gave up
+            remaining = remaining_time()
+            if not write.done.wait(None if remaining is None else max(remaining, 0)):
+                with self._lock:
+                    if not batch.flushing:
+                        # Not sent yet: withdraw it so it is never written
+                        batch.writes.remove(write)
+                metrics.increment("group_commit.wait_timeouts")
+                raise DeadlineExceeded("Request deadline exceeded")
+
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _flush(self, db: Session, writes: List[_PendingWrite]) -> None:
+        metrics.increment("group_commit.batches")
+        metrics.increment("group_commit.writes", len(writes))
+        # The batch carries other requests' writes, so it runs in its own
+        # session with no request deadline: the leader's statement_timeout
+        # must not fail the followers
+        token = request_deadline.set(None)
+        try:
+            with Session(bind=db.get_bind()) as flush_db:
+                self._flush_writes(flush_db, writes)
+        finally:
+            request_deadline.reset(token)
+            for write in writes:
+                write.done.set()
+
+    def _flush_writes(self, db: Session, writes: List[_PendingWrite]) -> None:
+        try:
+            creates = [w for w in writes if w.kind == "create"]
+            if creates:
+                self._insert_creates(db, creates)
+            for write in writes:
+                if write.kind == "update":
+                    self._run_isolated(db, write, self._apply_update)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for write in writes:
+                if write.error is None:
+                    write.error = e
+                    write.result = None
+
+    def _insert_creates(self, db: Session, creates: List[_PendingWrite]) -> None:
+        by_user: Dict[int, List[_PendingWrite]] = {}
+        for write in creates:
+            by_user.setdefault(write.user_id, []).append(write)
+        for user_id, user_creates in by_user.items():
+            keys = keys_between(last_position(db, user_id), None, len(user_creates))
+            for write, key in zip(user_creates, keys):
+                write.values = {**write.values, "position": key}
+
+        stmt = insert(todos_table).returning(*todos_table.c, sort_by_parameter_order=True)
+        try:
+            with db.begin_nested():
+                rows = db.execute(stmt, [{**w.values, "user_id": w.user_id} for w in creates]).all()
+        except Exception:
+            # Find out which rows are bad so only their callers see the error
+            for write in creates:
+                self._run_isolated(db, write, self._apply_create)
+            return
+        for write, row in zip(creates, rows):
+            write.result = Todo(**row._mapping)
+
+    def _run_isolated(self, db: Session, write: _PendingWrite, apply) -> None:
+        try:
+            with db.begin_nested():
+                write.result = apply(db, write)
+        except Exception as e:
+            write.error = e
+
+    def _apply_create(self, db: Session, write: _PendingWrite) -> Todo:
+        stmt = insert(todos_table).values(**write.values, user_id=write.user_id).returning(*todos_table.c)
+        return Todo(**db.execute(stmt).one()._mapping)
+
+    def _apply_update(self, db: Session, write: _PendingWrite) -> Optional[Todo]:
+        stmt = (
+            update(todos_table)
+            .where(todos_table.c.id == write.todo_id, todos_table.c.user_id == write.user_id)
+            .values(**write.values)
+            .returning(*todos_table.c)
+        )
+        row = db.execute(stmt).first()
+        return Todo(**row._mapping) if row else None
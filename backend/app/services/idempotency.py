@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import structlog
+from ..clients import get_redis
+from ..database import settings
+from ..metrics import metrics
+
+logger = structlog.get_logger()
+
+# Records are plain dicts:
+#   {"state": "pending", "fingerprint": ...}
+#   {"state": "done", "fingerprint": ..., "status": ..., "headers": [...], "body": ...}
+
+class MemoryIdempotencyStore:
+    """Per-process fallback store.
+
+    Entries live in an OrderedDict in insertion order, so expired keys are
+    evicted by popping from the front until the first live entry -- cheap
+    and amortized O(1). Lookups also check expiry, so an entry stuck behind
+    a longer-lived one is never served stale.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def begin(self, key: str, fingerprint: str, pending_ttl: float) -> Optional[dict]:
+        """Claim `key` for a new request, or return the record already holding it."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            self._entries[key] = (now + pending_ttl, {"state": "pending", "fingerprint": fingerprint})
+            self._entries.move_to_end(key)
+            return None
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def complete(self, key: str, record: dict, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, record)
+            self._entries.move_to_end(key)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+class RedisIdempotencyStore:
+    """Shared store; Redis key expiry does the eviction."""
+
+    def __init__(self, client, prefix: str = "idempotency:"):
+        self.client = client
+        self.prefix = prefix
+
+    def begin(self, key: str, fingerprint: str, pending_ttl: float) -> Optional[dict]:
+        pending = json.dumps({"state": "pending", "fingerprint": fingerprint})
+        if self.client.set(self.prefix + key, pending, nx=True, ex=max(int(pending_ttl), 1)):
+            return None
+        return self.get(key) or {"state": "pending", "fingerprint": fingerprint}
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value else None
+
+    def complete(self, key: str, record: dict, ttl: float) -> None:
+        self.client.set(self.prefix + key, json.dumps(record), ex=max(int(ttl), 1))
+
+    def release(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+_store = None
+_store_lock = threading.Lock()
+_next_probe = 0.0
+
+# How often a process that fell back to memory checks whether Redis is back
+REDIS_PROBE_INTERVAL = 30
+
+def get_idempotency_store():
+    """Return the configured store.
+
+    With IDEMPOTENCY_BACKEND=auto and Redis unreachable this is a
+    per-process memory store -- retries that land on another process are
+    not deduplicated -- and Redis is probed again every
+    REDIS_PROBE_INTERVAL seconds. Errors from a store once chosen are left
+    to the caller.
+    """
+    global _store, _next_probe
+    with _store_lock:
+        if _store is None or (
+            isinstance(_store, MemoryIdempotencyStore)
+            and settings.idempotency_backend == "auto"
+            and time.monotonic() >= _next_probe
+        ):
+            _store = _create_store(_store)
+            _next_probe = time.monotonic() + REDIS_PROBE_INTERVAL
+        return _store
+
+def _create_store(current):
+    backend = settings.idempotency_backend
+    if backend in ("auto", "redis"):
+        try:
+            client = get_redis()
+            client.ping()
+            metrics.set_gauge("idempotency.shared_store", 1)
+            return RedisIdempotencyStore(client)
+        except Exception as e:
+            if backend == "redis":
+                raise
+            logger.warning("Redis unavailable, using this process's in-memory idempotency store", error=str(e))
+    metrics.set_gauge("idempotency.shared_store", 0)
+    # Keep the entries we already have rather than starting over
+    return current or MemoryIdempotencyStore(settings.idempotency_max_entries)
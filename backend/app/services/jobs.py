@@ -0,0 +1,324 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+import structlog
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+from ..database import SessionLocal, settings
+from ..models.job import Job
+from ..models.user import User
+from .export import EXPORT_MEDIA_TYPES, iter_export
+from .todo import compute_todo_analytics
+from .query import todos_query
+from .ordering import rebalance_positions
+
+logger = structlog.get_logger()
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Rows fetched per round trip while streaming an export to disk
+EXPORT_FETCH_SIZE = 500
+
+class JobLimitExceeded(Exception):
+    pass
+
+def _run_export(db: Session, job: Job, output) -> str:
+    params = job.params or {}
+    format = params.get("format", "json")
+    if format not in EXPORT_MEDIA_TYPES:
+        raise ValueError("Invalid format. Use 'json' or 'csv'.")
+    query = todos_query(
+        db,
+        user_id=job.user_id,
+        search=params.get("search"),
+        completed=params.get("completed"),
+        sort_by=params.get("sort_by", "created_at"),
+        sort_order=params.get("sort_order", "desc"),
+        include_archived=bool(params.get("include_archived", False)),
+        filter_text=params.get("filter"),
+    )
+    for chunk in iter_export(format, query.yield_per(EXPORT_FETCH_SIZE)):
+        output.write(chunk)
+    return EXPORT_MEDIA_TYPES[format]
+
+def _run_analytics(db: Session, job: Job, output) -> str:
+    analytics = compute_todo_analytics(db, user_id=job.user_id)
+    output.write(json.dumps(analytics).encode())
+    return "application/json"
+
+def _run_rebalance(db: Session, job: Job, output) -> str:
+    count = rebalance_positions(db, user_id=job.user_id)
+    output.write(json.dumps({"todos": count}).encode())
+    return "application/json"
+
+# Each handler streams its artifact into a binary file object and returns the
+# artifact's media type.
+JOB_HANDLERS: Dict[str, Callable[[Session, Job, object], str]] = {
+    "export": _run_export,
+    "analytics": _run_analytics,
+    # Internal: queued by request_rebalance, not submittable through the API
+    "rebalance_positions": _run_rebalance,
+}
+
+def _lock_user(db: Session, user_id: int) -> None:
+    # Serializes a user's check-then-insert job submissions; SQLite already
+    # serializes writers
+    if db.get_bind().dialect.name == "postgresql":
+        db.query(User.id).filter(User.id == user_id).with_for_update().first()
+
+def submit_job(db: Session, user_id: int, kind: str, params: dict) -> Job:
+    _lock_user(db, user_id)
+    active = db.query(Job).filter(Job.user_id == user_id, Job.status.in_(ACTIVE_STATUSES)).count()
+    if active >= settings.jobs_max_active_per_user:
+        raise JobLimitExceeded(f"At most {settings.jobs_max_active_per_user} active jobs per user")
+
+    job = Job(user_id=user_id, kind=kind, params=params, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    worker_pool.notify()
+    return job
+
+def request_rebalance(db: Session, user_id: int) -> Optional[Job]:
+    """Queue a position rebalance for the user unless one is already pending."""
+    _lock_user(db, user_id)
+    pending = db.query(Job).filter(
+        Job.user_id == user_id,
+        Job.kind == "rebalance_positions",
+        Job.status.in_(ACTIVE_STATUSES),
+    ).first()
+    if pending is not None:
+        return None
+    # Not counted against jobs_max_active_per_user: the user didn't ask for it
+    job = Job(user_id=user_id, kind="rebalance_positions", params={}, status="queued")
+    db.add(job)
+    db.commit()
+    worker_pool.notify()
+    return job
+
+def get_job(db: Session, job_id: int, user_id: int) -> Optional[Job]:
+    return db.query(Job).filter(Job.id == job_id, Job.user_id == user_id).first()
+
+def get_jobs(db: Session, user_id: int, skip: int = 0, limit: int = 20) -> List[Job]:
+    return (
+        db.query(Job)
+        .filter(Job.user_id == user_id)
+        .order_by(Job.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def recover_expired_jobs(db: Session) -> int:
+    """Requeue running jobs whose worker stopped heartbeating.
+
+    A job that has already been claimed jobs_max_attempts times is failed
+    instead, so one that kills its worker can't loop forever.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=settings.jobs_lease_seconds)
+    expired = and_(Job.status == "running", func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff)
+    failed = db.query(Job).filter(expired, Job.attempts >= settings.jobs_max_attempts).update(
+        {Job.status: "failed", Job.error: "Worker stopped while running the job", Job.finished_at: now},
+        synchronize_session=False,
+    )
+    requeued = db.query(Job).filter(expired).update(
+        {Job.status: "queued", Job.heartbeat_at: None},
+        synchronize_session=False,
+    )
+    db.commit()
+    if failed or requeued:
+        logger.warning("Recovered expired jobs", requeued=requeued, failed=failed)
+    return failed + requeued
+
+def purge_expired_results(db: Session, limit: int = 100) -> int:
+    """Delete artifacts older than jobs_result_ttl_hours; their jobs become `expired`."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.jobs_result_ttl_hours)
+    jobs = (
+        db.query(Job)
+        .filter(Job.status == "succeeded", Job.finished_at < cutoff)
+        .order_by(Job.id)
+        .limit(limit)
+        .all()
+    )
+    for job in jobs:
+        if job.result_path:
+            try:
+                os.remove(job.result_path)
+            except FileNotFoundError:
+                pass
+        job.status = "expired"
+        job.result_path = None
+    db.commit()
+    return len(jobs)
+
+def claim_next_job(db: Session) -> Optional[Job]:
+    """Atomically move the oldest queued job to running and return it.
+
+    Expired leases are recovered first, so a job whose worker died is
+    picked up again instead of counting as active forever.
+    """
+    recover_expired_jobs(db)
+    query = db.query(Job).filter(Job.status == "queued").order_by(Job.id)
+    if db.get_bind().dialect.name == "postgresql":
+        # Lets several workers (threads or processes) poll the same table
+        query = query.with_for_update(skip_locked=True)
+    job = query.first()
+    if job is None:
+        db.rollback()
+        return None
+    job.status = "running"
+    job.started_at = job.heartbeat_at = datetime.now(timezone.utc)
+    job.attempts = (job.attempts or 0) + 1
+    db.commit()
+    db.refresh(job)
+    return job
+
+def result_path_for(job: Job) -> str:
+    # Per attempt: a worker whose lease expired may still be writing
+    return os.path.join(settings.jobs_result_dir, str(job.user_id), f"job-{job.id}-{job.attempts}")
+
+def run_job(db: Session, job: Job) -> bool:
+    """Run a claimed job and record the outcome.
+
+    The outcome is only written while this attempt still holds the job;
+    if the lease expired and the job was claimed again, the result is
+    discarded and False returned.
+    """
+    job_id, attempt = job.id, job.attempts
+    handler = JOB_HANDLERS.get(job.kind)
+    path = result_path_for(job)
+    tmp_path = f"{path}.part"
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as output:
+            media_type = handler(db, job, output)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        db.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        logger.error("Job failed", job_id=job_id, kind=job.kind, error=str(e), exc_info=True)
+        outcome = {Job.status: "failed", Job.error: str(e)}
+    else:
+        outcome = {
+            Job.status: "succeeded",
+            Job.result_path: path,
+            Job.result_size: os.path.getsize(path),
+            Job.result_media_type: media_type,
+        }
+    outcome[Job.finished_at] = datetime.now(timezone.utc)
+    finished = db.query(Job).filter(
+        Job.id == job_id, Job.status == "running", Job.attempts == attempt
+    ).update(outcome, synchronize_session=False)
+    db.commit()
+    if not finished:
+        logger.warning("Job lease lost; discarding result", job_id=job_id, attempt=attempt)
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    return True
+
+class JobWorkerPool:
+    """Threads that claim and run queued jobs.
+
+    The same loop backs `python -m app.worker`, so jobs can be moved out of
+    the API process by running that and setting JOBS_WORKERS=0. While a
+    job runs, a heartbeat renews its lease every third of
+    jobs_lease_seconds; idle workers also purge expired artifacts.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], workers: int, poll_interval: float):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+
+    def start(self) -> None:
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def run_once(self) -> bool:
+        db = self.session_factory()
+        try:
+            job = claim_next_job(db)
+            if job is None:
+                self._purge_results(db)
+                return False
+            beating = threading.Event()
+            heartbeat = threading.Thread(
+                target=self._heartbeat,
+                args=(job.id, job.attempts, beating),
+                name=f"job-heartbeat-{job.id}",
+                daemon=True,
+            )
+            heartbeat.start()
+            try:
+                run_job(db, job)
+            finally:
+                beating.set()
+                heartbeat.join()
+            return True
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_id: int, attempt: int, stop: threading.Event) -> None:
+        # Own session: the worker's session is busy running the job
+        while not stop.wait(settings.jobs_lease_seconds / 3):
+            db = self.session_factory()
+            try:
+                db.query(Job).filter(
+                    Job.id == job_id, Job.status == "running", Job.attempts == attempt
+                ).update(
+                    {Job.heartbeat_at: datetime.now(timezone.utc)}, synchronize_session=False
+                )
+                db.commit()
+            except Exception as e:
+                logger.warning("Job heartbeat failed", job_id=job_id, error=str(e))
+            finally:
+                db.close()
+
+    def _purge_results(self, db: Session) -> None:
+        # One worker thread purges at a time, at most once a minute
+        with self._purge_lock:
+            if time.monotonic() < self._next_purge:
+                return
+            self._next_purge = time.monotonic() + 60
+        purged = purge_expired_results(db)
+        if purged:
+            logger.info("Purged expired job results", jobs=purged)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                ran = self.run_once()
+            except Exception as e:
+                logger.error("Job worker error", error=str(e), exc_info=True)
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+
+worker_pool = JobWorkerPool(SessionLocal, settings.jobs_workers, settings.jobs_poll_interval_seconds)
@@ -0,0 +1,303 @@
+"""Fractional (lexicographic) order keys for manual todo ordering.
+
+Keys are base-62 strings that sort correctly with plain byte comparison
+(the column uses the "C" collation on PostgreSQL). There is always room
+for a key between any two keys, so moving an item only rewrites that one
+row. A key is a variable-length integer part -- its first character
+encodes the length, so appending to the end stays short -- followed by an
+optional fraction that grows when items are repeatedly squeezed between the
+same neighbours. Same scheme as the widely used `fractional-indexing`
+package.
+"""
+from typing import List, Optional
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from ..database import settings
+from ..metrics import metrics
+from ..models.todo import Todo
+from .versions import bump_write_version
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+ZERO = DIGITS[0]
+SMALLEST_INTEGER = "A" + ZERO * 26
+
+class OrderKeyError(ValueError):
+    pass
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    """Fraction strictly between a and b (b=None means 1)."""
+    if b is not None and a >= b:
+        raise OrderKeyError(f"{a!r} >= {b!r}")
+    if a.endswith(ZERO) or (b and b.endswith(ZERO)):
+        raise OrderKeyError("fraction has a trailing zero")
+    if b:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else ZERO) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+    if digit_b - digit_a > 1:
+        return DIGITS[round((digit_a + digit_b) / 2)]
+    if b and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise OrderKeyError(f"invalid order key head {head!r}")
+
+def _integer_part(key: str) -> str:
+    length = _integer_length(key[0])
+    if length > len(key):
+        raise OrderKeyError(f"invalid order key {key!r}")
+    return key[:length]
+
+def _validate(key: str) -> None:
+    if key == SMALLEST_INTEGER:
+        raise OrderKeyError(f"invalid order key {key!r}")
+    integer = _integer_part(key)
+    if key[len(integer):].endswith(ZERO):
+        raise OrderKeyError(f"invalid order key {key!r}")
+
+def _increment_integer(x: str) -> Optional[str]:
+    head, digits = x[0], list(x[1:])
+    carry = True
+    for i in range(len(digits) - 1, -1, -1):
+        d = DIGITS.index(digits[i]) + 1
+        if d == len(DIGITS):
+            digits[i] = ZERO
+        else:
+            digits[i] = DIGITS[d]
+            carry = False
+            break
+    if not carry:
+        return head + "".join(digits)
+    if head == "Z":
+        return "a" + ZERO
+    if head == "z":
+        return None
+    new_head = chr(ord(head) + 1)
+    if new_head > "a":
+        digits.append(ZERO)
+    else:
+        digits.pop()
+    return new_head + "".join(digits)
+
+def _decrement_integer(x: str) -> Optional[str]:
+    head, digits = x[0], list(x[1:])
+    borrow = True
+    for i in range(len(digits) - 1, -1, -1):
+        d = DIGITS.index(digits[i]) - 1
+        if d == -1:
+            digits[i] = DIGITS[-1]
+        else:
+            digits[i] = DIGITS[d]
+            borrow = False
+            break
+    if not borrow:
+        return head + "".join(digits)
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    new_head = chr(ord(head) - 1)
+    if new_head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return new_head + "".join(digits)
+
+def key_between(a: Optional[str], b: Optional[str]) -> str:
+    """Return a key that sorts strictly between a and b (None = open end)."""
+    if a is not None:
+        _validate(a)
+    if b is not None:
+        _validate(b)
+    if a is not None and b is not None and a >= b:
+        raise OrderKeyError(f"{a!r} >= {b!r}")
+
+    if a is None:
+        if b is None:
+            return "a" + ZERO
+        integer_b = _integer_part(b)
+        fraction_b = b[len(integer_b):]
+        if integer_b == SMALLEST_INTEGER:
+            return integer_b + _midpoint("", fraction_b)
+        if integer_b < b:
+            return integer_b
+        result = _decrement_integer(integer_b)
+        if result is None:
+            raise OrderKeyError("cannot decrement any more")
+        return result
+
+    integer_a = _integer_part(a)
+    fraction_a = a[len(integer_a):]
+    if b is None:
+        result = _increment_integer(integer_a)
+        return integer_a + _midpoint(fraction_a, None) if result is None else result
+
+    integer_b = _integer_part(b)
+    fraction_b = b[len(integer_b):]
+    if integer_a == integer_b:
+        return integer_a + _midpoint(fraction_a, fraction_b)
+    result = _increment_integer(integer_a)
+    if result is None:
+        raise OrderKeyError("cannot increment any more")
+    if result < b:
+        return result
+    return integer_a + _midpoint(fraction_a, None)
+
+def keys_between(a: Optional[str], b: Optional[str], n: int) -> List[str]:
+    """Return n ascending keys between a and b, kept as short as possible."""
+    if n == 0:
+        return []
+    if n == 1:
+        return [key_between(a, b)]
+    if b is None:
+        keys = [key_between(a, None)]
+        for _ in range(n - 1):
+            keys.append(key_between(keys[-1], None))
+        return keys
+    if a is None:
+        keys = [key_between(None, b)]
+        for _ in range(n - 1):
+            keys.append(key_between(None, keys[-1]))
+        return keys[::-1]
+    mid = n // 2
+    c = key_between(a, b)
+    return keys_between(a, c, mid) + [c] + keys_between(c, b, n - mid - 1)
+
+def needs_rebalance(key: Optional[str]) -> bool:
+    return key is not None and len(key) > settings.position_rebalance_length
+
+# Database side. Every helper below reads through the (user_id, position)
+# index and touches at most one row, except the backfill and rebalance.
+
+todos_table = Todo.__table__
+
+class InvalidMove(ValueError):
+    pass
+
+def last_position(db: Session, user_id: int) -> Optional[str]:
+    return db.query(func.max(Todo.position)).filter(Todo.user_id == user_id).scalar()
+
+def _position_of(db: Session, todo_id: int, user_id: int) -> Optional[Row]:
+    return db.query(Todo.id, Todo.position).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
+
+def _next_position(db: Session, user_id: int, after: str, exclude_id: Optional[int]) -> Optional[str]:
+    query = db.query(Todo.position).filter(Todo.user_id == user_id, Todo.position > after)
+    if exclude_id is not None:
+        query = query.filter(Todo.id != exclude_id)
+    return query.order_by(Todo.position.asc()).limit(1).scalar()
+
+def _previous_position(db: Session, user_id: int, before: str, exclude_id: Optional[int]) -> Optional[str]:
+    query = db.query(Todo.position).filter(Todo.user_id == user_id, Todo.position < before)
+    if exclude_id is not None:
+        query = query.filter(Todo.id != exclude_id)
+    return query.order_by(Todo.position.desc()).limit(1).scalar()
+
+def _break_tie(db: Session, user_id: int, position: str) -> bool:
+    """Give todos sharing `position` distinct keys, keeping their list order.
+
+    Creates that race can read the same last key. Nothing fits between two
+    equal keys, so a move next to one of them first spreads the tie over
+    the gap to the neighbouring keys. Only the tied rows are written.
+    """
+    ids = [
+        row.id for row in
+        db.query(Todo.id)
+        .filter(Todo.user_id == user_id, Todo.position == position)
+        .order_by(Todo.created_at, Todo.id)
+    ]
+    if len(ids) < 2:
+        return False
+    previous = _previous_position(db, user_id, position, exclude_id=None)
+    following = _next_position(db, user_id, position, exclude_id=None)
+    _write_positions(db, user_id, ids, keys_between(previous, following, len(ids)))
+    metrics.increment("ordering.ties_broken", len(ids))
+    return True
+
+def backfill_positions(db: Session, user_id: int) -> int:
+    """Give a user's unpositioned todos keys after the last positioned one.
+
+    Todos created before manual ordering existed have no key; they keep
+    their creation order. The caller commits.
+    """
+    ids = [
+        row.id for row in
+        db.query(Todo.id)
+        .filter(Todo.user_id == user_id, Todo.position.is_(None))
+        .order_by(Todo.created_at, Todo.id)
+    ]
+    if ids:
+        keys = keys_between(last_position(db, user_id), None, len(ids))
+        _write_positions(db, user_id, ids, keys)
+    return len(ids)
+
+def position_for_move(
+    db: Session,
+    todo_id: int,
+    user_id: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+) -> str:
+    """Key that places `todo_id` right after `after_id` and/or before `before_id`."""
+    if after_id is None and before_id is None:
+        raise InvalidMove("Give after_id, before_id or both")
+    if todo_id in (after_id, before_id):
+        raise InvalidMove("A todo cannot be moved relative to itself")
+
+    references = [ref for ref in (after_id, before_id) if ref is not None]
+    rows = {row.id: row for row in (_position_of(db, ref, user_id) for ref in references) if row}
+    if len(rows) != len(references):
+        raise InvalidMove("Reference todo not found")
+    if any(row.position is None for row in rows.values()):
+        backfill_positions(db, user_id)
+        rows = {ref: _position_of(db, ref, user_id) for ref in references}
+    tied = [position for position in {row.position for row in rows.values()} if _break_tie(db, user_id, position)]
+    if tied:
+        rows = {ref: _position_of(db, ref, user_id) for ref in references}
+
+    lower = rows[after_id].position if after_id is not None else None
+    upper = rows[before_id].position if before_id is not None else None
+    if lower is not None and upper is not None and lower >= upper:
+        raise InvalidMove("after_id must come before before_id")
+    if lower is not None and upper is None:
+        upper = _next_position(db, user_id, lower, exclude_id=todo_id)
+    elif upper is not None and lower is None:
+        lower = _previous_position(db, user_id, upper, exclude_id=todo_id)
+    return key_between(lower, upper)
+
+def rebalance_positions(db: Session, user_id: int) -> int:
+    """Rewrite all of a user's keys as short, evenly spaced ones. Commits."""
+    query = (
+        db.query(Todo.id)
+        .filter(Todo.user_id == user_id)
+        .order_by(Todo.position.asc().nulls_last(), Todo.created_at, Todo.id)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        # Moves that race with the rewrite wait instead of being lost
+        query = query.with_for_update()
+    ids = [row.id for row in query]
+    _write_positions(db, user_id, ids, keys_between(None, None, len(ids)))
+    db.commit()
+    bump_write_version(user_id)
+    metrics.increment("ordering.rebalanced_todos", len(ids))
+    return len(ids)
+
+def _write_positions(db: Session, user_id: int, ids: List[int], keys: List[str]) -> None:
+    stmt = (
+        update(todos_table)
+        .where(todos_table.c.user_id == user_id, todos_table.c.id == bindparam("todo_id"))
+        .values(position=bindparam("new_position"))
+    )
+    db.execute(
+        stmt,
+        [{"todo_id": todo_id, "new_position": key} for todo_id, key in zip(ids, keys)],
+    )
@@ -0,0 +1,335 @@
+"""Shared todo query builder and its small filter language.
+
+    completed:true AND (created>=2024-01-01 OR "milk")
+    updated:2024-03-01..2024-04-01 text:groceries
+
+Terms:
+    completed:true|false
+    created / updated with >, >=, <, <= and an ISO date or datetime, or
+        `:start..end` (half-open) / `:day` (that whole day); naive times are UTC
+    text:word, "quoted words" or a bare word -- case-insensitive substring
+        of title or description
+Terms combine with AND / OR (adjacent terms mean AND; AND binds tighter)
+and parentheses.
+
+Parsed nodes compile to SQL with `to_sql(source)` and can evaluate a row
+in memory with `matches(record)`.
+"""
+import operator
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import and_, asc, desc, or_, text
+from sqlalchemy.orm import Query, Session
+from ..database import settings
+from ..models.todo import Todo
+from .archive import todos_with_archive
+
+class InvalidQuery(ValueError):
+    pass
+
+class FilterSyntaxError(InvalidQuery):
+    pass
+
+# Sort keys clients may use. Each has a (user_id, key) index, so a page is
+# read in index order instead of sorting all of the user's rows.
+SORT_KEYS = ("created_at", "updated_at", "title", "completed", "position", "id")
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands back naive datetimes; stored times are UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+class Text:
+    __slots__ = ("value",)
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def to_sql(self, source):
+        pattern = f"%{_escape_like(self.value)}%"
+        return or_(source.title.ilike(pattern, escape="\\"), source.description.ilike(pattern, escape="\\"))
+
+    def matches(self, record) -> bool:
+        needle = self.value.lower()
+        return needle in (record.title or "").lower() or needle in (record.description or "").lower()
+
+class Completed:
+    __slots__ = ("value",)
+
+    def __init__(self, value: bool):
+        self.value = value
+
+    def to_sql(self, source):
+        return source.completed == self.value
+
+    def matches(self, record) -> bool:
+        return record.completed == self.value
+
+COMPARISONS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+class Compare:
+    __slots__ = ("field", "op", "value")
+
+    def __init__(self, field: str, op: str, value: datetime):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def to_sql(self, source):
+        return COMPARISONS[self.op](getattr(source, self.field), self.value)
+
+    def matches(self, record) -> bool:
+        value = _as_utc(getattr(record, self.field))
+        return value is not None and COMPARISONS[self.op](value, self.value)
+
+class And:
+    __slots__ = ("children",)
+
+    def __init__(self, children: list):
+        self.children = children
+
+    def to_sql(self, source):
+        return and_(*[child.to_sql(source) for child in self.children])
+
+    def matches(self, record) -> bool:
+        return all(child.matches(record) for child in self.children)
+
+class Or:
+    __slots__ = ("children",)
+
+    def __init__(self, children: list):
+        self.children = children
+
+    def to_sql(self, source):
+        return or_(*[child.to_sql(source) for child in self.children])
+
+    def matches(self, record) -> bool:
+        return any(child.matches(record) for child in self.children)
+
+_QUOTED = r'"(?:[^"\\]|\\.)*"'
+_TOKEN = re.compile(rf"""
+    \s*(?:
+        (?P<paren>[()])
+      | (?P<field>[A-Za-z_]+)\s*(?P<op>>=|<=|>|<|:|=)\s*(?P<value>{_QUOTED}|[^\s()]+)
+      | (?P<word>{_QUOTED}|[^\s()]+)
+    )""", re.VERBOSE)
+
+DATE_FIELDS = {"created": "created_at", "created_at": "created_at", "updated": "updated_at", "updated_at": "updated_at"}
+BOOLEANS = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+def _parse_time(value: str) -> datetime:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise FilterSyntaxError(f"Invalid date: {value!r}")
+    return _as_utc(parsed)
+
+def _next_day(value: datetime) -> datetime:
+    try:
+        return value + timedelta(days=1)
+    except OverflowError:
+        raise FilterSyntaxError(f"Date out of range: {value.date().isoformat()}")
+
+def _term(field: str, op: str, value: str):
+    name = field.lower()
+    value = _unquote(value)
+    if name == "text" and op in (":", "="):
+        return Text(value)
+    if name == "completed" and op in (":", "="):
+        if value.lower() not in BOOLEANS:
+            raise FilterSyntaxError(f"completed expects true or false, not {value!r}")
+        return Completed(BOOLEANS[value.lower()])
+    if name in DATE_FIELDS:
+        column = DATE_FIELDS[name]
+        if op in COMPARISONS:
+            return Compare(column, op, _parse_time(value))
+        start, sep, end = value.partition("..")
+        if sep:
+            bounds = []
+            if start:
+                bounds.append(Compare(column, ">=", _parse_time(start)))
+            if end:
+                bounds.append(Compare(column, "<", _parse_time(end)))
+            if not bounds:
+                raise FilterSyntaxError(f"Empty range for {field}")
+            return bounds[0] if len(bounds) == 1 else And(bounds)
+        day = _parse_time(value)
+        return And([Compare(column, ">=", day), Compare(column, "<", _next_day(day))])
+    raise FilterSyntaxError(f"Unknown filter {field}{op}")
+
+def _tokenize(source: str) -> list:
+    tokens = []
+    position = 0
+    while position < len(source):
+        if source[position:].strip() == "":
+            break
+        match = _TOKEN.match(source, position)
+        if match is None:
+            raise FilterSyntaxError(f"Unexpected input at {position}")
+        position = match.end()
+        if match.group("paren"):
+            tokens.append(("paren", match.group("paren")))
+        elif match.group("field"):
+            tokens.append(("term", _term(match.group("field"), match.group("op"), match.group("value"))))
+        else:
+            word = match.group("word")
+            if word.upper() in ("AND", "OR"):
+                tokens.append(("op", word.upper()))
+            else:
+                tokens.append(("term", Text(_unquote(word))))
+    return tokens
+
+# Parenthesised groups may nest this deep; the parser recurses once per level
+MAX_FILTER_DEPTH = 32
+
+class _Parser:
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.index = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.index] if self.index < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.index += 1
+        return token
+
+    def parse(self):
+        node = self.expression()
+        if self.peek()[0] is not None:
+            raise FilterSyntaxError(f"Unexpected {self.peek()[1]!r}")
+        return node
+
+    def expression(self):
+        children = [self.conjunction()]
+        while self.peek() == ("op", "OR"):
+            self.take()
+            children.append(self.conjunction())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def conjunction(self):
+        children = [self.atom()]
+        while True:
+            kind, value = self.peek()
+            if (kind, value) == ("op", "AND"):
+                self.take()
+            elif kind not in ("term", "paren") or value == ")":
+                break
+            children.append(self.atom())
+        return children[0] if len(children) == 1 else And(children)
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == "term":
+            return value
+        if (kind, value) == ("paren", "("):
+            self.depth += 1
+            if self.depth > MAX_FILTER_DEPTH:
+                raise FilterSyntaxError(f"Filter nests more than {MAX_FILTER_DEPTH} levels deep")
+            node = self.expression()
+            self.depth -= 1
+            if self.take() != ("paren", ")"):
+                raise FilterSyntaxError("Missing )")
+            return node
+        raise FilterSyntaxError("Expected a filter term" if kind is None else f"Unexpected {value!r}")
+
+def parse_filter(source: Optional[str]):
+    """Parse the filter language into nodes; None for an empty filter."""
+    if not source or not source.strip():
+        return None
+    return _Parser(_tokenize(source)).parse()
+
+def build_filter(search: Optional[str] = None, completed: Optional[bool] = None, filter_text: Optional[str] = None):
+    """Combine the legacy search/completed parameters with a filter expression."""
+    parts: List = []
+    if search:
+        parts.append(Text(search))
+    if completed is not None:
+        parts.append(Completed(completed))
+    parsed = parse_filter(filter_text)
+    if parsed is not None:
+        parts.append(parsed)
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else And(parts)
+
+def check_sort(sort_by: str, sort_order: str) -> None:
+    if sort_by not in SORT_KEYS:
+        raise InvalidQuery(f"Invalid sort_by. Use one of: {', '.join(SORT_KEYS)}")
+    if sort_order not in ("asc", "desc"):
+        raise InvalidQuery("Invalid sort_order. Use 'asc' or 'desc'.")
+
+def todos_query(
+    db: Session,
+    user_id: int,
+    search: Optional[str] = None,
+    completed: Optional[bool] = None,
+    sort_by: str = "created_at",
+    sort_order: str = "desc",
+    include_archived: bool = False,
+    filter_text: Optional[str] = None
+) -> Query:
+    """Unpaginated, sorted query over a user's todos.
+
+    Lists, counts (`.order_by(None).count()`), exports and export jobs all
+    start from this. Raises InvalidQuery for a bad sort or filter.
+    """
+    check_sort(sort_by, sort_order)
+    node = build_filter(search, completed, filter_text)
+
+    source = todos_with_archive() if include_archived else Todo
+    query = db.query(source).filter(source.user_id == user_id)
+    if node is not None:
+        query = query.filter(node.to_sql(source))
+
+    direction = desc if sort_order == "desc" else asc
+    sort_column = direction(getattr(source, sort_by))
+    if sort_by == "position":
+        # Unpositioned (pre-ordering) todos follow in creation order
+        query = query.order_by(sort_column.nulls_last(), source.created_at, source.id)
+    else:
+        query = query.order_by(sort_column)
+
+    if settings.query_plan_guard:
+        assert_no_seq_scan(db, query)
+    return query
+
+class SeqScanDetected(AssertionError):
+    pass
+
+def assert_no_seq_scan(db: Session, query: Query) -> None:
+    """Test-mode guard: fail if the plan reads the whole todos table.
+
+    PostgreSQL plans with enable_seqscan off, so a "Seq Scan on todos" only
+    remains when no index can serve the query. SQLite reports a full pass as
+    "SCAN todos" (an index search is "SEARCH todos ...").
+    """
+    connection = db.connection()
+    compiled = query.statement.compile(dialect=connection.dialect)
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        try:
+            plan = connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params).scalars().all()
+        finally:
+            connection.execute(text("RESET enable_seqscan"))
+        offending = [line for line in plan if re.search(r"Seq Scan on todos\b", line)]
+    elif connection.dialect.name == "sqlite":
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+        offending = [line for line in plan if re.match(r"SCAN todos\b", line)]
+    else:
+        return
+    if offending:
+        raise SeqScanDetected(f"Full scan of todos: {offending}\n" + "\n".join(plan))
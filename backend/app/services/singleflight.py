@@ -0,0 +1,74 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+from ..deadline import DeadlineExceeded, is_deadline_error, remaining_time
+from ..metrics import metrics
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Deduplicate identical concurrent calls.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight block and receive the same result (or exception). Nothing is
+    cached once the call finishes, so results must be safe to share between
+    threads -- return plain data or Pydantic models, never ORM objects bound
+    to the leader's session.
+
+    Followers wait no longer than their own request deadline. If the leader
+    failed because of its deadline (DeadlineExceeded, or a statement_timeout
+    derived from it), that error isn't theirs: they retry, one of them
+    becoming the new leader.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._leaders = 0
+        self._shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._leaders += 1
+                else:
+                    self._shared += 1
+                ratio = self._shared / (self._leaders + self._shared)
+
+            metrics.increment(f"singleflight.{self.name}.{'leaders' if leader else 'shared'}")
+            metrics.set_gauge(f"singleflight.{self.name}.dedupe_ratio", round(ratio, 4))
+
+            if leader:
+                return self._lead(key, call, fn)
+
+            remaining = remaining_time()
+            if not call.done.wait(None if remaining is None else max(remaining, 0)):
+                metrics.increment(f"singleflight.{self.name}.wait_timeouts")
+                raise DeadlineExceeded("Request deadline exceeded")
+            if call.error is None:
+                return call.result
+            if not is_deadline_error(call.error):
+                raise call.error
+            metrics.increment(f"singleflight.{self.name}.retries")
+
+    def _lead(self, key: Hashable, call: _Call, fn: Callable[[], Any]) -> Any:
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
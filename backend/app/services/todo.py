@@ -1,89 +1,190 @@
+import time
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, desc, asc
 from ..models.todo import Todo
 from ..models.user import User
-from ..schemas.todo import TodoCreate, TodoUpdate
+from ..schemas.todo import TodoCreate, TodoUpdate, TodoResponse
+from .singleflight import SingleFlight
+from .versions import get_write_version, bump_write_version
+from .group_commit import GroupCommitter
+from .query import todos_query, build_filter, check_sort
+from .archive import count_archived_todos, get_archived_todo, unarchive_todo, delete_archived_todo
+from .ordering import key_between, last_position, position_for_move
+from .working_set import working_set
+from ..metrics import metrics
+from ..database import settings
+
+todo_reads = SingleFlight("todos")
+
+group_committer = GroupCommitter(
+    window=settings.group_commit_window_ms / 1000,
+    max_batch=settings.group_commit_max_batch,
+)
+
+def _committed_write(user_id: int) -> None:
+    # Coalesced reads key on the version; the working set drops the user's copy
+    bump_write_version(user_id)
+    working_set.invalidate(user_id)
 
 def get_todos(
     db: Session, 
     user_id: int, 
+    search: Optional[str] = None,
     completed: Optional[bool] = None,
     skip: int = 0, 
     limit: int = 100,
     sort_by: str = "created_at",
-    sort_order: str = "desc"
+    sort_order: str = "desc",
+    include_archived: bool = False,
+    filter_text: Optional[str] = None
 ) -> List[Todo]:
-    query = db.query(Todo).filter(Todo.user_id == user_id)
-    
-    # Filter by completion status
-    if completed is not None:
-        query = query.filter(Todo.completed == completed)
-    
-    # Apply sorting
-    sort_column = getattr(Todo, sort_by, Todo.created_at)
-    if sort_order == "desc":
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-    
+    query = todos_query(
+        db, user_id=user_id, search=search, completed=completed, sort_by=sort_by,
+        sort_order=sort_order, include_archived=include_archived, filter_text=filter_text
+    )
     return query.offset(skip).limit(limit).all()
 
-def search_todos(
-    db: Session, 
-    user_id: int, 
-    search: str,
+def compute_todo_analytics(db: Session, user_id: int) -> dict:
+    # Only completed todos are archived, so they count towards both totals
+    archived_todos = count_archived_todos(db, user_id=user_id)
+    total_todos = db.query(Todo).filter(Todo.user_id == user_id).count() + archived_todos
+    completed_todos = db.query(Todo).filter(
+        Todo.user_id == user_id,
+        Todo.completed == True
+    ).count() + archived_todos
+    pending_todos = total_todos - completed_todos
+    completion_rate = (completed_todos / total_todos * 100) if total_todos > 0 else 0
+
+    return {
+        "total_todos": total_todos,
+        "completed_todos": completed_todos,
+        "pending_todos": pending_todos,
+        "completion_rate": round(completion_rate, 2)
+    }
+
+def read_todos_page(
+    db: Session,
+    user_id: int,
+    search: Optional[str] = None,
     completed: Optional[bool] = None,
-    skip: int = 0, 
-    limit: int = 100,
+    skip: int = 0,
+    limit: int = 10,
     sort_by: str = "created_at",
-    sort_order: str = "desc"
-) -> List[Todo]:
-    query = db.query(Todo).filter(
-        Todo.user_id == user_id,
-        or_(
-            Todo.title.ilike(f"%{search}%"),
-            Todo.description.ilike(f"%{search}%")
-        )
+    sort_order: str = "desc",
+    include_archived: bool = False,
+    filter_text: Optional[str] = None
+) -> dict:
+    """One page of todos plus the total count, shared by identical concurrent reads.
+
+    Raises InvalidQuery before any database work for a bad sort or filter.
+    """
+    search = search or None
+    filter_text = filter_text or None
+    check_sort(sort_by, sort_order)
+    node = build_filter(search, completed, filter_text)
+    if settings.working_set_enabled and not include_archived:
+        page = working_set.read_page(db, user_id, node, sort_by, sort_order, skip, limit)
+        if page is not None:
+            return page
+
+    key = (
+        "list", user_id, get_write_version(user_id),
+        search, completed, filter_text, skip, limit, sort_by, sort_order, include_archived
     )
-    
-    # Filter by completion status
-    if completed is not None:
-        query = query.filter(Todo.completed == completed)
-    
-    # Apply sorting
-    sort_column = getattr(Todo, sort_by, Todo.created_at)
-    if sort_order == "desc":
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-    
-    return query.offset(skip).limit(limit).all()
 
-def get_todo(db: Session, todo_id: int, user_id: int) -> Optional[Todo]:
-    return db.query(Todo).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
+    def load():
+        start = time.perf_counter()
+        query = todos_query(
+            db, user_id=user_id, search=search, completed=completed, sort_by=sort_by,
+            sort_order=sort_order, include_archived=include_archived, filter_text=filter_text
+        )
+        total = query.order_by(None).count()
+        todos = query.offset(skip).limit(limit).all()
+        page = {"todos": [TodoResponse.model_validate(todo) for todo in todos], "total": total}
+        metrics.observe("todos.list.db", time.perf_counter() - start)
+        return page
+
+    return todo_reads.do(key, load)
+
+def read_todo_analytics(db: Session, user_id: int) -> dict:
+    key = ("analytics", user_id, get_write_version(user_id))
+    return todo_reads.do(key, lambda: compute_todo_analytics(db, user_id=user_id))
+
+def get_todo(db: Session, todo_id: int, user_id: int, include_archived: bool = False) -> Optional[Todo]:
+    db_todo = db.query(Todo).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
+    if db_todo is None and include_archived:
+        return get_archived_todo(db, todo_id=todo_id, user_id=user_id)
+    return db_todo
 
 def create_todo(db: Session, todo: TodoCreate, user_id: int) -> Todo:
-    db_todo = Todo(**todo.dict(), user_id=user_id)
+    if settings.group_commit_enabled:
+        # The batch assigns positions, distinct across its creates
+        db_todo = group_committer.create(db, user_id=user_id, values=todo.dict())
+        _committed_write(user_id)
+        return db_todo
+
+    # New todos go to the end of the user's manual order
+    db_todo = Todo(**todo.dict(), user_id=user_id, position=key_between(last_position(db, user_id), None))
     db.add(db_todo)
     db.commit()
+    _committed_write(user_id)
     db.refresh(db_todo)
     return db_todo
 
 def update_todo(db: Session, todo_id: int, todo_update: TodoUpdate, user_id: int) -> Optional[Todo]:
+    if settings.group_commit_enabled:
+        update_data = todo_update.dict(exclude_unset=True)
+        if not update_data:
+            return get_todo(db, todo_id=todo_id, user_id=user_id)
+        db_todo = group_committer.update(db, todo_id=todo_id, user_id=user_id, values=update_data)
+        if db_todo is None and unarchive_todo(db, todo_id=todo_id, user_id=user_id):
+            db.commit()
+            db_todo = group_committer.update(db, todo_id=todo_id, user_id=user_id, values=update_data)
+        if db_todo:
+            _committed_write(user_id)
+        return db_todo
+
     db_todo = db.query(Todo).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
+    if db_todo is None:
+        # Updating an archived todo brings it back into the hot table
+        db_todo = unarchive_todo(db, todo_id=todo_id, user_id=user_id)
     if db_todo:
         update_data = todo_update.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_todo, field, value)
         db.commit()
+        _committed_write(user_id)
         db.refresh(db_todo)
     return db_todo
 
+def move_todo(
+    db: Session,
+    todo_id: int,
+    user_id: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None
+) -> Optional[Todo]:
+    """Reorder one todo; only its own row is written. Raises InvalidMove."""
+    db_todo = db.query(Todo).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
+    if db_todo is None:
+        return None
+    db_todo.position = position_for_move(
+        db, todo_id=todo_id, user_id=user_id, after_id=after_id, before_id=before_id
+    )
+    db.commit()
+    _committed_write(user_id)
+    db.refresh(db_todo)
+    return db_todo
+
 def delete_todo(db: Session, todo_id: int, user_id: int) -> bool:
     db_todo = db.query(Todo).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
     if db_todo:
         db.delete(db_todo)
         db.commit()
+        _committed_write(user_id)
+        return True
+    if delete_archived_todo(db, todo_id=todo_id, user_id=user_id):
+        db.commit()
+        _committed_write(user_id)
         return True
     return False 
\ No newline at end of file
@@ -0,0 +1,36 @@
+import threading
+from collections import OrderedDict
+
+# Per-user write version, bumped after every committed write to a user's
+# todos. Coalesced reads include it in their key so a reader never joins a
+# flight that started before its own write was committed, and the working
+# set cache keys entries on it.
+#
+# Versions are process-local: a write committed by another process does not
+# change them, so the working set cache only sees it once the entry's ttl
+# expires (WORKING_SET_TTL_SECONDS).
+#
+# Only the MAX_TRACKED_USERS most recent writers are kept. Every bump takes
+# the next value of one process-wide counter, and an untracked user reads
+# the highest version evicted so far. A version therefore never goes back
+# to a value a reader has already seen, and changes after every write.
+MAX_TRACKED_USERS = 100000
+
+_write_versions: "OrderedDict[int, int]" = OrderedDict()
+_counter = 0
+_evicted_floor = 0
+_lock = threading.Lock()
+
+def get_write_version(user_id: int) -> int:
+    with _lock:
+        return _write_versions.get(user_id, _evicted_floor)
+
+def bump_write_version(user_id: int) -> None:
+    global _counter, _evicted_floor
+    with _lock:
+        _counter += 1
+        _write_versions[user_id] = _counter
+        _write_versions.move_to_end(user_id)
+        while len(_write_versions) > MAX_TRACKED_USERS:
+            _, version = _write_versions.popitem(last=False)
+            _evicted_floor = max(_evicted_floor, version)
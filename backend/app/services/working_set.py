@@ -0,0 +1,261 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..database import settings
+from ..metrics import metrics
+from ..models.todo import Todo
+from ..schemas.todo import TodoResponse
+from .singleflight import SingleFlight
+from .versions import get_write_version
+
+todos_table = Todo.__table__
+FIELDS = tuple(column.name for column in todos_table.c)
+
+class TodoRecord:
+    """One cached todo row; a few hundred bytes less than an ORM Todo."""
+    __slots__ = FIELDS
+
+    def __init__(self, row):
+        for name in FIELDS:
+            setattr(self, name, row[name])
+
+    def to_response(self) -> TodoResponse:
+        # Values came straight from the database, so skip validation
+        return TodoResponse.model_construct(**{name: getattr(self, name) for name in FIELDS})
+
+def _record_size(record: TodoRecord) -> int:
+    size = sys.getsizeof(record)
+    for name in FIELDS:
+        value = getattr(record, name)
+        if value is not None and not isinstance(value, (bool, int)):
+            size += sys.getsizeof(value)
+    return size
+
+class _UserSet:
+    """All of one user's (unarchived) todos plus sorted id orders, built on demand."""
+    __slots__ = ("records", "orders", "version", "loaded_at", "nulls_first", "size")
+
+    def __init__(self, records: Dict[int, TodoRecord], version: int, nulls_first: bool):
+        self.records = records
+        self.orders: Dict[Tuple[str, str], List[int]] = {}
+        self.version = version
+        self.loaded_at = time.monotonic()
+        # Where NULLs sort in ascending order: last on PostgreSQL, first on SQLite
+        self.nulls_first = nulls_first
+        self.size = sys.getsizeof(records) + sum(_record_size(record) for record in records.values())
+
+    def order(self, sort_by: str, sort_order: str) -> List[int]:
+        """Ids in the order the database would return them (ties broken by id)."""
+        key = (sort_by, sort_order)
+        ids = self.orders.get(key)
+        if ids is None:
+            built = self._build_order(sort_by, sort_order)
+            # Two readers may build the same order; only the stored one counts
+            ids = self.orders.setdefault(key, built)
+            if ids is built:
+                self.size += sys.getsizeof(ids)
+        return ids
+
+    def _build_order(self, sort_by: str, sort_order: str) -> List[int]:
+        records = self.records.values()
+        if sort_by == "position":
+            # Mirrors the query: keys first in either direction, then unpositioned by creation
+            positioned = sorted((r for r in records if r.position is not None), key=lambda r: (r.position, r.id))
+            unpositioned = sorted((r for r in records if r.position is None), key=lambda r: (r.created_at, r.id))
+            if sort_order == "desc":
+                positioned.reverse()
+            return [r.id for r in positioned + unpositioned]
+
+        null_rank = 0 if self.nulls_first else 1
+
+        def sort_key(record):
+            value = getattr(record, sort_by)
+            return ((null_rank,) if value is None else (1 - null_rank, value), record.id)
+
+        ids = [r.id for r in sorted(records, key=sort_key)]
+        if sort_order == "desc":
+            ids.reverse()
+        return ids
+
+class WorkingSetCache:
+    """Per-worker read-through cache of hot users' todos.
+
+    A user is admitted after `min_reads` list reads within one `ttl` window
+    (a user reading less often than that would reload on every read, so is
+    left on the database path); their whole todo list is then loaded once
+    and list pages -- filters, sorts, counts and pagination -- are answered
+    from memory. Entries are keyed on the
+    per-user write version, so any committed write in this process makes
+    the next read reload, and expire after `ttl` to bound staleness from
+    writes made by other processes. Least recently used users are evicted
+    to stay within `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, max_todos: int, ttl: float, min_reads: int, tracked_users: int = 10000):
+        self.max_bytes = max_bytes
+        self.max_todos = max_todos
+        self.ttl = ttl
+        self.min_reads = min_reads
+        self.tracked_users = tracked_users
+        self._lock = threading.Lock()
+        self._sets: "OrderedDict[int, _UserSet]" = OrderedDict()
+        # user_id -> (start of the current read window, reads in it)
+        self._reads: "OrderedDict[int, Tuple[float, int]]" = OrderedDict()
+        self._too_large: Dict[int, int] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._lookups = 0
+        self._loads = SingleFlight("working_set")
+
+    def read_page(
+        self,
+        db: Session,
+        user_id: int,
+        node,
+        sort_by: str,
+        sort_order: str,
+        skip: int,
+        limit: int
+    ) -> Optional[dict]:
+        """A page shaped like read_todos_page's, or None to use the database."""
+        if sort_by == "title" and db.get_bind().dialect.name == "postgresql":
+            # Titles sort by the database's locale collation, not code points
+            metrics.increment("working_set.bypass")
+            return None
+
+        start = time.perf_counter()
+        version = get_write_version(user_id)
+        user_set = self._get(user_id, version)
+        hit = user_set is not None
+        if not hit and self._admit(user_id, version):
+            user_set = self._loads.do((user_id, version), lambda: self._load(db, user_id, version))
+        self._record_lookup(hit)
+        if user_set is None:
+            return None
+
+        size = user_set.size
+        ids = user_set.order(sort_by, sort_order)
+        if user_set.size != size:
+            self._account_growth(user_id, user_set, user_set.size - size)
+        records = user_set.records
+        if node is None:
+            total = len(ids)
+            page = [records[todo_id] for todo_id in ids[skip:skip + limit]]
+        else:
+            matched = [records[todo_id] for todo_id in ids if node.matches(records[todo_id])]
+            total = len(matched)
+            page = matched[skip:skip + limit]
+        result = {"todos": [record.to_response() for record in page], "total": total}
+        metrics.observe("working_set.read", time.perf_counter() - start)
+        return result
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            user_set = self._sets.pop(user_id, None)
+            if user_set is not None:
+                self._bytes -= user_set.size
+                self._publish()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sets.clear()
+            self._reads.clear()
+            self._too_large.clear()
+            self._bytes = 0
+            self._publish()
+
+    def _get(self, user_id: int, version: int) -> Optional[_UserSet]:
+        with self._lock:
+            user_set = self._sets.get(user_id)
+            if user_set is None:
+                return None
+            expired = time.monotonic() - user_set.loaded_at > self.ttl
+            if user_set.version != version or expired:
+                del self._sets[user_id]
+                if expired:
+                    # Readmit only if the user is still reading often
+                    self._reads.pop(user_id, None)
+                self._bytes -= user_set.size
+                self._publish()
+                return None
+            self._sets.move_to_end(user_id)
+            return user_set
+
+    def _admit(self, user_id: int, version: int) -> bool:
+        with self._lock:
+            if self._too_large.get(user_id) == version:
+                return False
+            now = time.monotonic()
+            started, reads = self._reads.pop(user_id, (now, 0))
+            if now - started > self.ttl:
+                started, reads = now, 0
+            reads += 1
+            self._reads[user_id] = (started, reads)
+            while len(self._reads) > self.tracked_users:
+                self._reads.popitem(last=False)
+            return reads >= self.min_reads
+
+    def _load(self, db: Session, user_id: int, version: int) -> Optional[_UserSet]:
+        start = time.perf_counter()
+        rows = db.execute(
+            select(*todos_table.c).where(todos_table.c.user_id == user_id).limit(self.max_todos + 1)
+        ).mappings().all()
+        if len(rows) > self.max_todos:
+            # Not worth holding; remember until the user's next write
+            with self._lock:
+                if len(self._too_large) >= self.tracked_users:
+                    self._too_large.clear()
+                self._too_large[user_id] = version
+            metrics.increment("working_set.too_large")
+            return None
+
+        records = {row["id"]: TodoRecord(row) for row in rows}
+        user_set = _UserSet(records, version, nulls_first=db.get_bind().dialect.name != "postgresql")
+        metrics.increment("working_set.loads")
+        metrics.observe("working_set.load", time.perf_counter() - start)
+        with self._lock:
+            previous = self._sets.pop(user_id, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._sets[user_id] = user_set
+            self._bytes += user_set.size
+            self._evict()
+            self._publish()
+        return user_set
+
+    def _account_growth(self, user_id: int, user_set: _UserSet, delta: int) -> None:
+        # A newly built sort order makes an entry bigger after it was loaded
+        with self._lock:
+            if self._sets.get(user_id) is user_set:
+                self._bytes += delta
+                self._evict()
+                self._publish()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._sets:
+            _, user_set = self._sets.popitem(last=False)
+            self._bytes -= user_set.size
+            metrics.increment("working_set.evictions")
+
+    def _record_lookup(self, hit: bool) -> None:
+        with self._lock:
+            self._lookups += 1
+            self._hits += hit
+            ratio = self._hits / self._lookups
+        metrics.increment("working_set.hits" if hit else "working_set.misses")
+        metrics.set_gauge("working_set.hit_rate", round(ratio, 4))
+
+    def _publish(self) -> None:
+        metrics.set_gauge("working_set.bytes", self._bytes)
+        metrics.set_gauge("working_set.users", len(self._sets))
+
+working_set = WorkingSetCache(
+    max_bytes=settings.working_set_max_bytes,
+    max_todos=settings.working_set_max_todos,
+    ttl=settings.working_set_ttl_seconds,
+    min_reads=settings.working_set_min_reads,
+)
@@ -0,0 +1,29 @@
+"""Standalone job worker.
+
+Run with `python -m app.worker` and set JOBS_WORKERS=0 on the API processes
+to keep exports and recomputes off the web workers entirely.
+"""
+import os
+import signal
+import threading
+from .database import SessionLocal, settings
+from .models import user, todo, job  # Import models to register them
+from .services.jobs import JobWorkerPool
+
+def main():
+    workers = int(os.getenv("WORKER_THREADS", "2"))
+    pool = JobWorkerPool(SessionLocal, workers, settings.jobs_poll_interval_seconds)
+    stopped = threading.Event()
+
+    def handle_signal(signum, frame):
+        stopped.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    pool.start()
+    stopped.wait()
+    pool.stop()
+
+if __name__ == "__main__":
+    main()
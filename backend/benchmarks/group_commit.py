@@ -0,0 +1,102 @@
+"""Write throughput: per-request commit vs group commit.
+
+Runs --threads concurrent writers, each doing --writes-per-thread todo
+creates (and optionally updates) through app.services.todo with a fresh
+session per write, the way request handlers do. Prints writes/sec and
+p50/p99 latency with group commit off and on.
+
+Point DATABASE_URL at a migrated PostgreSQL database (fsync cost is what
+group commit amortizes, so SQLite numbers aren't representative). Run from
+the backend directory:
+
+    python benchmarks/group_commit.py --threads 32 --writes-per-thread 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, settings
+from app.models.user import User
+from app.schemas.todo import TodoCreate, TodoUpdate
+from app.services.group_commit import GroupCommitter
+from app.services import todo as todo_service
+
+def bench_user_id():
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "bench_group_commit").first()
+        if user is None:
+            user = User(username="bench_group_commit", email="bench_group_commit@example.com", hashed_password="x")
+            db.add(user)
+            db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def run(user_id, threads, writes_per_thread, with_updates):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(n):
+        local = []
+        barrier.wait()
+        for i in range(writes_per_thread):
+            db = SessionLocal()
+            try:
+                start = time.perf_counter()
+                todo = todo_service.create_todo(db, TodoCreate(title=f"bench {n}-{i}"), user_id=user_id)
+                local.append(time.perf_counter() - start)
+                if with_updates:
+                    start = time.perf_counter()
+                    todo_service.update_todo(db, todo.id, TodoUpdate(completed=True), user_id=user_id)
+                    local.append(time.perf_counter() - start)
+            finally:
+                db.close()
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "writes_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--writes-per-thread", type=int, default=200)
+    parser.add_argument("--window-ms", type=float, default=settings.group_commit_window_ms)
+    parser.add_argument("--max-batch", type=int, default=settings.group_commit_max_batch)
+    parser.add_argument("--updates", action="store_true", help="Follow every create with an update")
+    args = parser.parse_args()
+
+    user_id = bench_user_id()
+    todo_service.group_committer = GroupCommitter(window=args.window_ms / 1000, max_batch=args.max_batch)
+
+    print(f"{'mode':<22} {'writes/s':>10} {'p50':>10} {'p99':>10}")
+    for label, enabled in (("per-request commit", False), ("group commit", True)):
+        settings.group_commit_enabled = enabled
+        result = run(user_id, args.threads, args.writes_per_thread, args.updates)
+        print(
+            f"{label:<22} {result['writes_per_sec']:>10.0f} "
+            f"{result['p50_ms']:>8.2f}ms {result['p99_ms']:>8.2f}ms",
+            flush=True,
+        )
+
+if __name__ == "__main__":
+    main()
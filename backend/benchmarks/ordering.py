@@ -0,0 +1,114 @@
+"""Cost of a manual reorder at large list sizes.
+
+Seeds one user with --todos todos (default 100k) in manual order, then makes
+--moves random moves through app.services.todo.move_todo, the same call
+PATCH /todos/{id}/move makes. Counts rows written per move by watching the
+engine's cursor executions, and prints it next to the rows a dense integer
+position column would have to renumber for the same moves, plus latency and
+key-length figures.
+
+Point DATABASE_URL at a migrated database (SQLite or PostgreSQL). Run
+from the backend directory:
+
+    python benchmarks/ordering.py --todos 100000 --moves 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, event, insert
+from app.database import SessionLocal, engine
+from app.models.todo import Todo
+from app.models.user import User
+from app.services import todo as todo_service
+from app.services.ordering import keys_between
+
+SEED_BATCH = 5000
+
+def seed(count):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "bench_ordering").first()
+        if user is None:
+            user = User(username="bench_ordering", email="bench_ordering@example.com", hashed_password="x")
+            db.add(user)
+            db.commit()
+        db.execute(delete(Todo.__table__).where(Todo.__table__.c.user_id == user.id))
+        keys = keys_between(None, None, count)
+        for start in range(0, count, SEED_BATCH):
+            db.execute(
+                insert(Todo.__table__),
+                [
+                    {"title": f"bench {i}", "completed": False, "user_id": user.id, "position": keys[i]}
+                    for i in range(start, min(start + SEED_BATCH, count))
+                ],
+            )
+        db.commit()
+        ids = [row.id for row in db.query(Todo.id).filter(Todo.user_id == user.id).order_by(Todo.position)]
+        return user.id, ids
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--todos", type=int, default=100_000)
+    parser.add_argument("--moves", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    user_id, order = seed(args.todos)
+
+    written = {"statements": 0, "rows": 0}
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            written["statements"] += 1
+            written["rows"] += max(cursor.rowcount, 0)
+
+    latencies = []
+    renumbered = 0
+    for _ in range(args.moves):
+        source = random.randrange(len(order))
+        todo_id = order.pop(source)
+        target = random.randrange(len(order) + 1)
+        after_id = order[target - 1] if target > 0 else None
+        before_id = order[target] if target < len(order) else None
+        order.insert(target, todo_id)
+        # A dense 0..n-1 position column shifts every row between the two slots
+        renumbered += abs(target - source) + 1
+
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            todo_service.move_todo(db, todo_id, user_id=user_id, after_id=after_id, before_id=before_id)
+            latencies.append(time.perf_counter() - start)
+        finally:
+            db.close()
+
+    db = SessionLocal()
+    try:
+        stored = [row.id for row in db.query(Todo.id).filter(Todo.user_id == user_id).order_by(Todo.position, Todo.id)]
+        key_lengths = [len(row.position) for row in db.query(Todo.position).filter(Todo.user_id == user_id)]
+    finally:
+        db.close()
+
+    latencies.sort()
+    print(f"todos                      {args.todos}")
+    print(f"moves                      {args.moves}")
+    print(f"order matches              {stored == order}")
+    print(f"rows written / move        {written['rows'] / args.moves:.2f}")
+    print(f"write statements / move    {written['statements'] / args.moves:.2f}")
+    print(f"integer renumbering / move {renumbered / args.moves:.0f}")
+    print(f"move p50 / p99             {statistics.median(latencies) * 1000:.2f}ms / "
+          f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.2f}ms")
+    print(f"key length mean / max      {statistics.mean(key_lengths):.1f} / {max(key_lengths)}")
+
+if __name__ == "__main__":
+    main()
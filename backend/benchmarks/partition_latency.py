@@ -0,0 +1,118 @@
+"""Per-user query latency as the todos table grows.
+
+Grows `todos` in steps (default 1M, 10M, 100M rows spread over --users
+users) and after each step times the same per-user queries the API runs:
+a page of get_todos and its count. With user_id hash partitioning and the
+user_id index the latency should stay flat as the total grows.
+
+Needs a PostgreSQL database at DATABASE_URL migrated to head. Rows are
+generated server side with generate_series, so a 100M step needs disk space
+and takes a while. Run from the backend directory:
+
+    python benchmarks/partition_latency.py --steps 1000000 10000000 100000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app.database import SessionLocal, engine
+from app.models.todo import Todo
+from app.services.todo import get_todos
+
+INSERT_BATCH = 1_000_000
+
+def ensure_users(conn, users):
+    existing = conn.execute(text("SELECT count(*) FROM users WHERE username LIKE 'bench_%'")).scalar()
+    if existing >= users:
+        return
+    conn.execute(
+        text(
+            "INSERT INTO users (username, email, hashed_password, is_active) "
+            "SELECT 'bench_' || g, 'bench_' || g || '@example.com', 'x', true "
+            "FROM generate_series(:start, :stop) AS g"
+        ),
+        {"start": existing + 1, "stop": users},
+    )
+
+def user_ids(conn):
+    return conn.execute(text("SELECT id FROM users WHERE username LIKE 'bench_%' ORDER BY id")).scalars().all()
+
+def grow_to(target, ids):
+    """Insert rows until todos holds `target` rows, spread evenly over `ids`."""
+    with engine.connect() as conn:
+        current = conn.execute(text("SELECT count(*) FROM todos")).scalar()
+    while current < target:
+        batch = min(INSERT_BATCH, target - current)
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "INSERT INTO todos (title, description, completed, user_id) "
+                    "SELECT 'todo ' || g, 'benchmark row', g % 3 = 0, "
+                    "(:ids)[1 + (g % array_length(:ids, 1))] "
+                    "FROM generate_series(:start, :stop) AS g"
+                ),
+                {"ids": ids, "start": current, "stop": current + batch - 1},
+            )
+        current += batch
+        print(f"  inserted {current}/{target}", flush=True)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE todos"))
+
+def time_queries(ids, samples):
+    list_times, count_times = [], []
+    db = SessionLocal()
+    try:
+        for user_id in random.sample(ids, min(samples, len(ids))):
+            start = time.perf_counter()
+            get_todos(db, user_id=user_id, skip=0, limit=20)
+            list_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            db.query(Todo).filter(Todo.user_id == user_id).count()
+            count_times.append(time.perf_counter() - start)
+            db.rollback()
+    finally:
+        db.close()
+    return list_times, count_times
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[1_000_000, 10_000_000, 100_000_000])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--samples", type=int, default=200, help="Users timed per step")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("This benchmark needs PostgreSQL")
+
+    with engine.begin() as conn:
+        ensure_users(conn, args.users)
+        ids = list(user_ids(conn))
+        partitioned = conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'todos'::regclass"
+        )).first() is not None
+
+    print(f"todos partitioned: {partitioned}, users: {len(ids)}")
+    print(f"{'total rows':>12} {'list p50':>10} {'list p95':>10} {'count p50':>10} {'count p95':>10}")
+    for target in sorted(args.steps):
+        grow_to(target, ids)
+        list_times, count_times = time_queries(ids, args.samples)
+        print(
+            f"{target:>12} "
+            f"{statistics.median(list_times) * 1000:>8.2f}ms {percentile(list_times, 95) * 1000:>8.2f}ms "
+            f"{statistics.median(count_times) * 1000:>8.2f}ms {percentile(count_times, 95) * 1000:>8.2f}ms",
+            flush=True,
+        )
+
+if __name__ == "__main__":
+    main()
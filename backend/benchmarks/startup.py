@@ -0,0 +1,105 @@
+"""Cold-start benchmark.
+
+Measures, over several fresh interpreter runs:
+  * import time of `app.main`
+  * time from spawning uvicorn to the first successful GET /health
+
+Run from the backend directory:
+
+    python benchmarks/startup.py --runs 5 --output startup-results.jsonl
+
+Appending each run to a JSONL file lets the numbers be compared across
+releases (each line carries the app version and git revision).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def measure_import(env):
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env)
+    return float(output.strip().splitlines()[-1])
+
+def measure_first_response(env, timeout):
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"No response from uvicorn within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summarize(samples):
+    return {
+        "min_ms": round(min(samples) * 1000, 1),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    # Background workers would only add noise to a startup measurement
+    env = {**os.environ, "JOBS_WORKERS": "0", "PYTHONDONTWRITEBYTECODE": "1"}
+
+    sys.path.insert(0, BACKEND_DIR)
+    from app.main import app
+
+    import_times = [measure_import(env) for _ in range(args.runs)]
+    first_response_times = [measure_first_response(env, args.timeout) for _ in range(args.runs)]
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "version": app.version,
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import": summarize(import_times),
+        "first_response": summarize(first_response_times),
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""List latency: database path vs the per-worker working-set cache.
+
+Seeds one user with --todos todos, then serves --reads list pages through
+app.services.todo.read_todos_page (what GET /todos/ calls), cycling through
+a few sorts and filters, first with the working set off and then on.
+Prints p50/p99 per mode plus the cache's hit rate and memory use.
+
+Point DATABASE_URL at a migrated database. Run from the backend directory:
+
+    python benchmarks/working_set.py --todos 2000 --reads 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, insert
+from app.database import SessionLocal, settings
+from app.metrics import metrics
+from app.models.todo import Todo
+from app.models.user import User
+from app.services import todo as todo_service
+from app.services.ordering import keys_between
+from app.services.working_set import working_set
+
+PAGES = [
+    {},
+    {"sort_by": "position", "sort_order": "asc", "skip": 40},
+    {"completed": False, "sort_by": "updated_at"},
+    {"filter_text": 'text:"7" OR created>=2000-01-01', "sort_by": "id", "sort_order": "asc"},
+]
+
+def seed(count):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "bench_working_set").first()
+        if user is None:
+            user = User(username="bench_working_set", email="bench_working_set@example.com", hashed_password="x")
+            db.add(user)
+            db.commit()
+        db.execute(delete(Todo.__table__).where(Todo.__table__.c.user_id == user.id))
+        keys = keys_between(None, None, count)
+        db.execute(insert(Todo.__table__), [
+            {"title": f"todo {i}", "description": f"details {i}", "completed": i % 3 == 0,
+             "user_id": user.id, "position": keys[i]}
+            for i in range(count)
+        ])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def run(user_id, reads):
+    latencies = []
+    for i in range(reads):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            todo_service.read_todos_page(db, user_id=user_id, limit=20, **PAGES[i % len(PAGES)])
+            latencies.append(time.perf_counter() - start)
+        finally:
+            db.close()
+    latencies.sort()
+    return statistics.median(latencies) * 1000, latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--todos", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    user_id = seed(args.todos)
+    print(f"{'mode':<14} {'p50':>10} {'p99':>10}")
+    for label, enabled in (("database", False), ("working set", True)):
+        settings.working_set_enabled = enabled
+        working_set.clear()
+        metrics.reset()
+        p50, p99 = run(user_id, args.reads)
+        print(f"{label:<14} {p50:>8.2f}ms {p99:>8.2f}ms", flush=True)
+
+    gauges = metrics.snapshot()["gauges"]
+    print(f"hit rate       {gauges.get('working_set.hit_rate', 0):.2%}")
+    print(f"cache bytes    {gauges.get('working_set.bytes', 0):,.0f} for {args.todos} todos")
+
+if __name__ == "__main__":
+    main()
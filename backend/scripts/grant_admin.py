@@ -0,0 +1,36 @@
+"""Grant or revoke access to the admin-only /debug endpoints.
+
+Admin is a server-side flag on the user; nothing in the API can set it:
+
+    python scripts/grant_admin.py alice
+    python scripts/grant_admin.py alice --revoke
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.models import user, todo, job  # Import models to register them
+from app.models.user import User
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("username")
+    parser.add_argument("--revoke", action="store_true", help="Remove admin access instead")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        account = db.query(User).filter(User.username == args.username).first()
+        if account is None:
+            sys.exit(f"No user named {args.username!r}")
+        account.is_admin = not args.revoke
+        db.commit()
+        print(f"{args.username}: admin {'revoked' if args.revoke else 'granted'}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
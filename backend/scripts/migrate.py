@@ -0,0 +1,58 @@
+"""Bring the database schema up to date; run before starting the API.
+
+Databases created before migrations existed (the app used to run
+create_all at startup) have the users and todos tables but no
+alembic_version table. Those are stamped at 0001, which is exactly that
+schema, and then upgraded like any other database. Every replica runs
+this at startup, so on PostgreSQL the whole run holds an advisory lock:
+replicas starting together migrate one at a time, and the later ones find
+the schema already at head.
+
+    python scripts/migrate.py
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from app.database import engine
+
+BASELINE_REVISION = "0001"
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_ID = 0x746F646F
+
+@contextmanager
+def migration_lock():
+    """Hold a session-level advisory lock on PostgreSQL; a no-op elsewhere."""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as connection:
+        connection.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK_ID})")
+        connection.commit()
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_ID})")
+            connection.commit()
+
+def main():
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+
+    with migration_lock():
+        # Inspect under the lock, so a replica that waited sees the stamp
+        # written by the one before it
+        inspector = inspect(engine)
+        if not inspector.has_table("alembic_version") and inspector.has_table("users"):
+            print(f"Existing unversioned schema found; stamping {BASELINE_REVISION}", flush=True)
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Online migration of `todos` to the hash-partitioned table.
+
+Alembic revision 0003 creates `todos_partitioned` and a trigger that mirrors
+new writes into it. This tool finishes the job without long locks:
+
+    python scripts/partition_todos.py status
+    python scripts/partition_todos.py backfill --batch-size 5000 --sleep 0.05
+    python scripts/partition_todos.py swap
+    python scripts/partition_todos.py drop-old
+
+`backfill` copies existing rows in small id ranges, one short transaction per
+batch, and can be stopped and resumed at any time. `status` compares the
+two tables row by row, so run it before `swap`. `swap` takes an ACCESS
+EXCLUSIVE lock only long enough to rename the tables.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app.database import engine
+
+def _table_exists(conn, name):
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+def _mirror_installed(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM pg_trigger WHERE tgname = 'todos_mirror_to_partitioned'"
+    )).first() is not None
+
+def _check_prepared(conn):
+    if engine.dialect.name != "postgresql":
+        sys.exit("Partitioning is only supported on PostgreSQL")
+    if not _table_exists(conn, "todos_partitioned") or not _mirror_installed(conn):
+        sys.exit("todos_partitioned is not prepared; run `alembic upgrade head` first "
+                 "(or the swap has already happened)")
+
+def _differences(conn, lower, upper):
+    """Ids in (lower, upper] whose rows differ between the two tables."""
+    return conn.execute(
+        text(
+            "SELECT id FROM ("
+            "  (SELECT * FROM todos WHERE id > :lower AND id <= :upper"
+            "   EXCEPT SELECT * FROM todos_partitioned WHERE id > :lower AND id <= :upper)"
+            "  UNION ALL"
+            "  (SELECT * FROM todos_partitioned WHERE id > :lower AND id <= :upper"
+            "   EXCEPT SELECT * FROM todos WHERE id > :lower AND id <= :upper)"
+            ") AS diff ORDER BY id"
+        ),
+        {"lower": lower, "upper": upper},
+    ).scalars().all()
+
+def status(args):
+    # One snapshot for the whole check; the mirror trigger writes both tables
+    # in the same transaction, so any difference seen here is real
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        if _table_exists(conn, "todos_partitioned") and _mirror_installed(conn):
+            source = conn.execute(text("SELECT count(*) FROM todos")).scalar()
+            copied = conn.execute(text("SELECT count(*) FROM todos_partitioned")).scalar()
+            print(f"backfill pending: {copied}/{source} rows copied")
+            max_id = conn.execute(text(
+                "SELECT greatest((SELECT max(id) FROM todos), (SELECT max(id) FROM todos_partitioned))"
+            )).scalar() or 0
+            different = []
+            for lower in range(0, max_id, args.batch_size):
+                different += _differences(conn, lower, lower + args.batch_size)
+            if different:
+                ids = sorted(set(different))
+                sample = ", ".join(str(todo_id) for todo_id in ids[:10])
+                print(f"{len(ids)} rows differ (ids {sample}{', ...' if len(ids) > 10 else ''}); "
+                      "do not swap until backfill has copied them")
+            else:
+                print("contents match; ready to swap")
+        elif conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'todos'::regclass"
+        )).first():
+            old = "present" if _table_exists(conn, "todos_unpartitioned") else "dropped"
+            print(f"todos is partitioned (todos_unpartitioned: {old})")
+        else:
+            print("todos is not partitioned and no shadow table exists")
+
+def backfill(args):
+    with engine.connect() as conn:
+        _check_prepared(conn)
+
+    last_id = args.start_after
+    copied = 0
+    started = time.time()
+    while True:
+        # One short transaction per batch keeps row locks and WAL bursts small.
+        # FOR SHARE holds off concurrent updates and deletes of the batch's rows
+        # until the copy commits, so the mirror trigger then sees (and replaces
+        # or removes) the copied row instead of leaving a stale one behind.
+        with engine.begin() as conn:
+            max_id = conn.execute(text("SELECT coalesce(max(id), 0) FROM todos")).scalar()
+            if last_id >= max_id:
+                break
+            upper = last_id + args.batch_size
+            result = conn.execute(
+                text(
+                    "INSERT INTO todos_partitioned SELECT * FROM todos "
+                    "WHERE id > :lower AND id <= :upper FOR SHARE ON CONFLICT DO NOTHING"
+                ),
+                {"lower": last_id, "upper": upper},
+            )
+            copied += result.rowcount
+        last_id = upper
+        elapsed = time.time() - started
+        print(f"copied through id {min(last_id, max_id)}/{max_id} ({copied} rows, {elapsed:.1f}s)", flush=True)
+        if args.sleep:
+            time.sleep(args.sleep)
+    print(f"backfill complete: {copied} rows copied; rerun `status` before `swap`")
+
+def swap(args):
+    with engine.begin() as conn:
+        _check_prepared(conn)
+        conn.execute(text(f"SET LOCAL lock_timeout = '{int(args.lock_timeout * 1000)}ms'"))
+        conn.execute(text("LOCK TABLE todos IN ACCESS EXCLUSIVE MODE"))
+
+        conn.execute(text("DROP TRIGGER todos_mirror_to_partitioned ON todos"))
+        conn.execute(text("DROP FUNCTION todos_mirror_to_partitioned()"))
+        conn.execute(text("ALTER SEQUENCE todos_id_seq OWNED BY todos_partitioned.id"))
+
+        old_indexes = conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'todos' AND indexname LIKE 'ix_todos_%'"
+        )).scalars().all()
+        for index in old_indexes:
+            conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "ix_todos_unpartitioned_{index[len("ix_todos_"):]}"'))
+        conn.execute(text("ALTER TABLE todos RENAME TO todos_unpartitioned"))
+
+        new_indexes = conn.execute(text(
+            "SELECT indexname FROM pg_indexes "
+            "WHERE tablename = 'todos_partitioned' AND indexname LIKE 'ix_todos_partitioned_%'"
+        )).scalars().all()
+        for index in new_indexes:
+            conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "ix_todos_{index[len("ix_todos_partitioned_"):]}"'))
+        conn.execute(text("ALTER TABLE todos_partitioned RENAME TO todos"))
+    print("swapped: todos is now partitioned; old data kept in todos_unpartitioned")
+
+def drop_old(args):
+    with engine.begin() as conn:
+        if not _table_exists(conn, "todos_unpartitioned"):
+            sys.exit("todos_unpartitioned does not exist")
+        conn.execute(text("DROP TABLE todos_unpartitioned"))
+    print("dropped todos_unpartitioned")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    status_parser = subparsers.add_parser("status")
+    status_parser.add_argument("--batch-size", type=int, default=50000, help="Ids compared per query")
+    status_parser.set_defaults(func=status)
+
+    backfill_parser = subparsers.add_parser("backfill")
+    backfill_parser.add_argument("--batch-size", type=int, default=5000, help="Ids per batch")
+    backfill_parser.add_argument("--sleep", type=float, default=0.05, help="Pause between batches in seconds")
+    backfill_parser.add_argument("--start-after", type=int, default=0, help="Resume after this id")
+    backfill_parser.set_defaults(func=backfill)
+
+    swap_parser = subparsers.add_parser("swap")
+    swap_parser.add_argument("--lock-timeout", type=float, default=5, help="Give up if the lock isn't granted in time")
+    swap_parser.set_defaults(func=swap)
+
+    subparsers.add_parser("drop-old").set_defaults(func=drop_old)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,17 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.database import get_db, Base
+from app.database import get_db, Base, settings
+from app.routers.auth import limiter as auth_limiter
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Start every run from an empty schema; tests register fixed usernames and
+# assert exact totals, which rows left by an earlier run would break
+Base.metadata.drop_all(bind=engine)
 Base.metadata.create_all(bind=engine)
 
 def override_get_db():
@@ -21,6 +25,9 @@ def override_get_db():
 
 app.dependency_overrides[get_db] = override_get_db
 
+# Every todo list/export query in these tests is EXPLAINed; a full scan of todos fails it
+settings.query_plan_guard = True
+
 client = TestClient(app)
 
 def test_read_main():
@@ -73,4 +80,733 @@ def test_login():
     assert data["token_type"] == "bearer" 
 
 def test_new():
-    pass
\ No newline at end of file
+    pass
+
+def auth_headers(username):
+    # Registration and login are rate limited per client address
+    auth_limiter.reset()
+    client.post(
+        "/auth/register",
+        json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "testpassword123"
+        }
+    )
+    response = client.post(
+        "/auth/token",
+        data={"username": username, "password": "testpassword123"}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_export_is_compressed():
+    headers = auth_headers("exportuser")
+    for i in range(30):
+        client.post("/todos/", json={"title": f"Todo {i}", "description": "x" * 50}, headers=headers)
+
+    response = client.get("/todos/export/json", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 30
+
+def test_small_response_not_compressed():
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+def test_export_job_result_supports_ranges(tmp_path, monkeypatch):
+    from app.database import settings
+    from app.services.jobs import JobWorkerPool
+
+    monkeypatch.setattr(settings, "jobs_result_dir", str(tmp_path))
+    headers = auth_headers("jobuser")
+    client.post("/todos/", json={"title": "Job todo"}, headers=headers)
+
+    response = client.post("/jobs/", json={"kind": "export", "params": {"format": "csv"}}, headers=headers)
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response.json()["status"] == "queued"
+
+    assert JobWorkerPool(TestingSessionLocal, 0, 0).run_once()
+
+    response = client.get(f"/jobs/{job_id}", headers=headers)
+    assert response.json()["status"] == "succeeded"
+
+    full = client.get(f"/jobs/{job_id}/result", headers=headers)
+    assert full.status_code == 200
+    assert b"Job todo" in full.content
+
+    partial = client.get(f"/jobs/{job_id}/result", headers={**headers, "Range": "bytes=0-1"})
+    assert partial.status_code == 206
+    assert partial.content == full.content[:2]
+    assert partial.headers["content-range"] == f"bytes 0-1/{len(full.content)}"
+
+def test_expired_job_leases_are_recovered_and_results_purged(tmp_path, monkeypatch):
+    import os
+    from datetime import datetime, timedelta, timezone
+    from app.database import settings
+    from app.models.job import Job
+    from app.services.jobs import JobWorkerPool, claim_next_job, purge_expired_results
+
+    monkeypatch.setattr(settings, "jobs_result_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "jobs_max_attempts", 2)
+    headers = auth_headers("leaseuser")
+    job_id = client.post("/jobs/", json={"kind": "analytics"}, headers=headers).json()["id"]
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=2)
+
+    def worker_dies(db):
+        job = claim_next_job(db)
+        assert job.id == job_id
+        job.started_at = job.heartbeat_at = long_ago
+        db.commit()
+
+    db = TestingSessionLocal()
+    try:
+        # A worker died mid-job: the expired lease is requeued and claimed again
+        worker_dies(db)
+        worker_dies(db)
+        assert db.get(Job, job_id).attempts == 2
+        # Out of attempts: failed, so it no longer counts as active
+        assert claim_next_job(db) is None
+        db.expire_all()
+        assert db.get(Job, job_id).status == "failed"
+
+        job_id = client.post("/jobs/", json={"kind": "analytics"}, headers=headers).json()["id"]
+        assert JobWorkerPool(TestingSessionLocal, 0, 0).run_once()
+        job = db.get(Job, job_id)
+        path = job.result_path
+        assert os.path.exists(path)
+        job.finished_at = datetime.now(timezone.utc) - timedelta(hours=settings.jobs_result_ttl_hours + 1)
+        db.commit()
+        assert purge_expired_results(db) == 1
+    finally:
+        db.close()
+    assert not os.path.exists(path)
+    response = client.get(f"/jobs/{job_id}/result", headers=headers)
+    assert response.status_code == 409
+
+def test_stale_worker_cannot_overwrite_a_reclaimed_job(tmp_path, monkeypatch):
+    import os
+    from datetime import datetime, timedelta, timezone
+    from app.database import settings
+    from app.models.job import Job
+    from app.services.jobs import claim_next_job, run_job
+
+    monkeypatch.setattr(settings, "jobs_result_dir", str(tmp_path))
+    headers = auth_headers("staleworker")
+    job_id = client.post("/jobs/", json={"kind": "analytics"}, headers=headers).json()["id"]
+
+    stale_db, fresh_db = TestingSessionLocal(), TestingSessionLocal()
+    try:
+        stale = claim_next_job(stale_db)
+        assert stale.id == job_id
+        # The stale worker stops heartbeating; another worker takes over
+        fresh_db.query(Job).filter(Job.id == job_id).update(
+            {Job.heartbeat_at: datetime.now(timezone.utc) - timedelta(hours=1)}
+        )
+        fresh_db.commit()
+        fresh = claim_next_job(fresh_db)
+        assert fresh.id == job_id and fresh.attempts == 2
+
+        assert run_job(stale_db, stale) is False
+        assert os.listdir(os.path.join(str(tmp_path), str(stale.user_id))) == []
+        assert run_job(fresh_db, fresh) is True
+    finally:
+        stale_db.close()
+        fresh_db.close()
+    job = client.get(f"/jobs/{job_id}", headers=headers).json()
+    assert job["status"] == "succeeded"
+    assert client.get(f"/jobs/{job_id}/result", headers=headers).status_code == 200
+
+def test_single_flight_shares_concurrent_calls():
+    import threading
+    import time
+    from app.services.singleflight import SingleFlight
+
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while flight._shared < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ["result"] * 5
+
+def test_single_flight_followers_do_not_inherit_the_leaders_deadline():
+    import threading
+    import time
+    from app.deadline import DeadlineExceeded, request_deadline
+    from app.services.singleflight import SingleFlight
+
+    flight = SingleFlight("deadline")
+    leader_running = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 1:
+            leader_running.set()
+            time.sleep(0.2)
+            raise DeadlineExceeded("Request deadline exceeded")
+        time.sleep(0.1)
+        return "result"
+
+    def call(deadline, outcomes):
+        request_deadline.set(None if deadline is None else time.monotonic() + deadline)
+        try:
+            outcomes.append(flight.do("key", load))
+        except DeadlineExceeded as e:
+            outcomes.append(e)
+
+    leader_outcome, follower_outcomes, impatient_outcome = [], [], []
+    leader = threading.Thread(target=call, args=(0.1, leader_outcome))
+    leader.start()
+    leader_running.wait(5)
+    followers = [threading.Thread(target=call, args=(None, follower_outcomes)) for _ in range(3)]
+    impatient = threading.Thread(target=call, args=(0.05, impatient_outcome))
+    started = time.monotonic()
+    for thread in followers + [impatient]:
+        thread.start()
+    impatient.join()
+    waited = time.monotonic() - started
+    for thread in followers + [leader]:
+        thread.join()
+
+    # The leader's own deadline error stays with the leader
+    assert isinstance(leader_outcome[0], DeadlineExceeded)
+    # Followers retried; one of them led the second call
+    assert follower_outcomes == ["result"] * 3
+    assert len(calls) == 2
+    # A follower gives up when its own deadline passes, not the leader's
+    assert isinstance(impatient_outcome[0], DeadlineExceeded)
+    assert waited < 0.15
+
+def test_write_versions_are_bounded_and_never_go_back(monkeypatch):
+    from collections import OrderedDict
+    from app.services import versions
+
+    monkeypatch.setattr(versions, "MAX_TRACKED_USERS", 2)
+    monkeypatch.setattr(versions, "_write_versions", OrderedDict())
+    seen = {}
+    for user_id in (1, 2, 1, 3, 4):
+        before = versions.get_write_version(user_id)
+        versions.bump_write_version(user_id)
+        seen[user_id] = versions.get_write_version(user_id)
+        assert seen[user_id] > before
+    assert len(versions._write_versions) == 2
+    # User 1 was evicted; it reads a version no lower than its last one
+    assert versions.get_write_version(1) >= seen[1]
+    before = versions.get_write_version(1)
+    versions.bump_write_version(1)
+    assert versions.get_write_version(1) > before
+
+def test_list_reflects_own_write():
+    headers = auth_headers("versionuser")
+    assert client.get("/todos/", headers=headers).json()["total"] == 0
+    client.post("/todos/", json={"title": "Fresh"}, headers=headers)
+    assert client.get("/todos/", headers=headers).json()["total"] == 1
+
+def test_admission_control_sheds_load_with_retry_after():
+    from app.middleware import AIMDLimiter
+
+    limiter = AIMDLimiter("test", initial_limit=1, min_limit=1, max_limit=4, latency_target=0.5)
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release(latency=0.01, overloaded=False)
+    assert limiter.limit == 2
+    assert limiter.try_acquire() and limiter.try_acquire()
+    limiter.release(latency=1.0, overloaded=False)
+    assert limiter.limit < 2
+
+def test_tiny_client_deadline_is_floored():
+    headers = auth_headers("deadlineuser")
+    # Raised to REQUEST_MIN_TIMEOUT_SECONDS, which a list comfortably fits in
+    response = client.get("/todos/", headers={**headers, "X-Request-Timeout": "0.000001"})
+    assert response.status_code == 200
+
+def test_streamed_body_may_outlast_the_deadline():
+    import asyncio
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+    from app.middleware import AIMDLimiter, AdmissionControlMiddleware
+
+    async def slow_body():
+        for _ in range(3):
+            await asyncio.sleep(0.1)
+            yield b"chunk\n"
+
+    streaming_app = FastAPI()
+
+    @streaming_app.get("/todos/export/slow")
+    def slow_export():
+        return StreamingResponse(slow_body(), media_type="text/plain")
+
+    limiter = AIMDLimiter("api", initial_limit=4, min_limit=1, max_limit=8, latency_target=0.5)
+    streaming_app.add_middleware(
+        AdmissionControlMiddleware, limiters={"api": limiter, "auth": limiter}, default_timeout=0.15
+    )
+
+    response = TestClient(streaming_app).get("/todos/export/slow")
+    assert response.status_code == 200
+    assert response.text == "chunk\n" * 3
+    # Only time to the response start feeds the limiter
+    assert limiter.limit > 4
+
+def test_client_chosen_deadline_does_not_shrink_the_limit():
+    import asyncio
+    from fastapi import FastAPI
+    from starlette.datastructures import Headers
+    from app.middleware import AIMDLimiter, AdmissionControlMiddleware
+
+    slow_app = FastAPI()
+
+    @slow_app.get("/todos/slow")
+    async def slow():
+        await asyncio.sleep(0.3)
+        return {}
+
+    limiter = AIMDLimiter("api", initial_limit=4, min_limit=1, max_limit=8, latency_target=1)
+    slow_app.add_middleware(
+        AdmissionControlMiddleware, limiters={"api": limiter, "auth": limiter}, default_timeout=0.2, min_timeout=0.05
+    )
+    slow_client = TestClient(slow_app)
+
+    # A deadline the client shortened (floored at min_timeout) is the client's business
+    for requested in ("0.000001", "0.1"):
+        response = slow_client.get("/todos/slow", headers={"X-Request-Timeout": requested})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+    assert limiter.limit == 4
+    # Non-finite values fall back to the default timeout
+    for requested in ("nan", "inf"):
+        assert AdmissionControlMiddleware(slow_app, {}, default_timeout=0.2).timeout_for(
+            Headers({"x-request-timeout": requested})
+        ) == 0.2
+    # Missing the server's own deadline is overload
+    assert slow_client.get("/todos/slow").status_code == 503
+    assert limiter.limit < 4
+
+def test_group_commit_batches_concurrent_creates():
+    import threading
+    from app.models.user import User
+    from app.services.group_commit import GroupCommitter
+
+    db = TestingSessionLocal()
+    user = User(username="groupuser", email="group@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    committer = GroupCommitter(window=0.5, max_batch=4)
+    results, errors = [], []
+
+    def write(i):
+        session = TestingSessionLocal()
+        try:
+            values = {"title": f"Batched {i}", "description": None, "completed": False}
+            if i == 3:
+                values["title"] = None  # violates NOT NULL; only this caller should fail
+            results.append(committer.create(session, user_id=user_id, values=values))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 1
+    assert sorted(todo.title for todo in results) == ["Batched 0", "Batched 1", "Batched 2"]
+    assert all(todo.id is not None and todo.user_id == user_id for todo in results)
+    # Creates in one batch get distinct keys
+    assert len({todo.position for todo in results}) == 3
+
+def test_group_commit_flush_ignores_request_deadlines():
+    import threading
+    import time
+    from app.deadline import DeadlineExceeded, request_deadline
+    from app.models.todo import Todo
+    from app.models.user import User
+    from app.services.group_commit import GroupCommitter
+
+    db = TestingSessionLocal()
+    user = User(username="groupdeadlineuser", email="groupdeadline@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    committer = GroupCommitter(window=0.3, max_batch=10)
+    flush_write = committer._flush_writes
+    seen = {}
+
+    def slow_flush(flush_db, writes):
+        seen["deadline"] = request_deadline.get()
+        seen["db"] = flush_db
+        time.sleep(0.6)
+        flush_write(flush_db, writes)
+
+    committer._flush_writes = slow_flush
+    results, errors, sessions = {}, {}, {}
+
+    def write(title, timeout):
+        if timeout is not None:
+            request_deadline.set(time.monotonic() + timeout)
+        session = sessions[title] = TestingSessionLocal()
+        try:
+            values = {"title": title, "description": None, "completed": False}
+            results[title] = committer.create(session, user_id=user_id, values=values)
+        except Exception as e:
+            errors[title] = e
+        finally:
+            session.close()
+
+    # The leader's deadline runs out while it waits for the window
+    leader = threading.Thread(target=write, args=("Leader", 0.05))
+    leader.start()
+    time.sleep(0.05)
+    followers = [
+        threading.Thread(target=write, args=("Withdrawn", 0.1)),  # expires before the flush
+        threading.Thread(target=write, args=("Gave up", 0.5)),  # expires during the flush
+        threading.Thread(target=write, args=("Patient", None)),
+    ]
+    for thread in followers:
+        thread.start()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert seen["deadline"] is None and seen["db"] is not sessions["Leader"]
+    assert set(results) == {"Leader", "Patient"}
+    assert all(isinstance(errors[title], DeadlineExceeded) for title in ("Withdrawn", "Gave up"))
+    db = TestingSessionLocal()
+    try:
+        titles = {todo.title for todo in db.query(Todo).filter(Todo.user_id == user_id)}
+    finally:
+        db.close()
+    # A follower that gave up mid-flush was already sent; one that gave up before was not
+    assert titles == {"Leader", "Gave up", "Patient"}
+
+def test_archived_todos_are_hidden_until_requested():
+    from app.services.archive import archive_completed_todos
+
+    headers = auth_headers("archiveuser")
+    todo_id = client.post("/todos/", json={"title": "Old", "completed": True}, headers=headers).json()["id"]
+    client.post("/todos/", json={"title": "Active"}, headers=headers)
+
+    db = TestingSessionLocal()
+    try:
+        # A negative age puts the cutoff in the future, so everything completed qualifies
+        assert archive_completed_todos(db, older_than_days=-1, batch_size=100) >= 1
+    finally:
+        db.close()
+
+    assert client.get("/todos/", headers=headers).json()["total"] == 1
+    assert client.get("/todos/?include_archived=true", headers=headers).json()["total"] == 2
+    assert client.get(f"/todos/{todo_id}", headers=headers).json()["title"] == "Old"
+    assert client.get("/todos/analytics", headers=headers).json()["completed_todos"] == 1
+
+    # Updating an archived todo moves it back to the hot table
+    response = client.put(f"/todos/{todo_id}", json={"completed": False}, headers=headers)
+    assert response.status_code == 200
+    assert client.get("/todos/", headers=headers).json()["total"] == 2
+
+def test_idempotency_key_replays_create():
+    headers = {**auth_headers("idempotentuser"), "Idempotency-Key": "create-1"}
+    first = client.post("/todos/", json={"title": "Once"}, headers=headers)
+    second = client.post("/todos/", json={"title": "Once"}, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert second.headers["idempotent-replayed"] == "true"
+    assert client.get("/todos/", headers=headers).json()["total"] == 1
+
+    reused = client.post("/todos/", json={"title": "Different"}, headers=headers)
+    assert reused.status_code == 422
+
+def test_idempotency_key_follows_the_user_not_the_token(monkeypatch):
+    from datetime import timedelta
+    from app.services import idempotency
+    from app.services.auth import create_access_token
+
+    headers = auth_headers("refreshuser")
+    refreshed = {"Authorization": f"Bearer {create_access_token({'sub': 'refreshuser'}, timedelta(minutes=5))}"}
+    assert refreshed != headers
+    first = client.post("/todos/", json={"title": "Once"}, headers={**headers, "Idempotency-Key": "refresh-1"})
+    retry = client.post("/todos/", json={"title": "Once"}, headers={**refreshed, "Idempotency-Key": "refresh-1"})
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json()["id"] == first.json()["id"]
+
+    # Login responses hold tokens and are never stored
+    auth_limiter.reset()
+    login = {"username": "refreshuser", "password": "testpassword123"}
+    for _ in range(2):
+        response = client.post("/auth/token", data=login, headers={"Idempotency-Key": "login-1"})
+        assert response.status_code == 200
+        assert "idempotent-replayed" not in response.headers
+
+    # A failing store costs deduplication, not the request
+    class BrokenStore:
+        def begin(self, *args):
+            raise ConnectionError("store down")
+
+    monkeypatch.setattr(idempotency, "_store", BrokenStore())
+    response = client.post("/todos/", json={"title": "Unprotected"}, headers={**headers, "Idempotency-Key": "down-1"})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Unprotected"
+
+def test_idempotency_key_does_not_store_rejections():
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+    from app.middleware import IdempotencyMiddleware
+    from app.services.auth import create_access_token
+
+    calls = []
+    limited_app = FastAPI()
+
+    @limited_app.post("/todos/")
+    def create():
+        calls.append(1)
+        if len(calls) == 1:
+            return JSONResponse({"detail": "Rate limit exceeded"}, status_code=429)
+        return {"created": len(calls)}
+
+    limited_app.add_middleware(IdempotencyMiddleware)
+    limited_client = TestClient(limited_app)
+    token = create_access_token({"sub": "limiteduser"})
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "retry-after-429"}
+
+    assert limited_client.post("/todos/", json={}, headers=headers).status_code == 429
+    retried = limited_client.post("/todos/", json={}, headers=headers)
+    assert retried.status_code == 200
+    assert "idempotent-replayed" not in retried.headers
+    replayed = limited_client.post("/todos/", json={}, headers=headers)
+    assert replayed.json() == {"created": 2}
+    assert replayed.headers["idempotent-replayed"] == "true"
+
+def test_move_todo_reorders_with_single_key():
+    headers = auth_headers("orderuser")
+    ids = [client.post("/todos/", json={"title": f"T{i}"}, headers=headers).json()["id"] for i in range(3)]
+
+    def order():
+        todos = client.get("/todos/?sort_by=position&sort_order=asc", headers=headers).json()["todos"]
+        return [todo["id"] for todo in todos]
+
+    assert order() == ids
+
+    response = client.patch(f"/todos/{ids[2]}/move", json={"after_id": ids[0]}, headers=headers)
+    assert response.status_code == 200
+    assert order() == [ids[0], ids[2], ids[1]]
+
+    response = client.patch(f"/todos/{ids[1]}/move", json={"before_id": ids[0]}, headers=headers)
+    assert response.status_code == 200
+    assert order() == [ids[1], ids[0], ids[2]]
+
+    assert client.patch(f"/todos/{ids[0]}/move", json={}, headers=headers).status_code == 400
+    assert client.patch(
+        f"/todos/{ids[0]}/move", json={"after_id": ids[2], "before_id": ids[1]}, headers=headers
+    ).status_code == 400
+
+def test_move_next_to_tied_positions():
+    from app.models.todo import Todo
+
+    headers = auth_headers("tieuser")
+    ids = [client.post("/todos/", json={"title": f"T{i}"}, headers=headers).json()["id"] for i in range(4)]
+    # Racing creates can read the same last key
+    db = TestingSessionLocal()
+    try:
+        tied = db.query(Todo.position).filter(Todo.id == ids[0]).scalar()
+        db.query(Todo).filter(Todo.id.in_(ids[:3])).update({Todo.position: tied}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    def order():
+        todos = client.get("/todos/?sort_by=position&sort_order=asc", headers=headers).json()["todos"]
+        return [todo["id"] for todo in todos]
+
+    assert order() == ids
+    response = client.patch(f"/todos/{ids[3]}/move", json={"after_id": ids[0]}, headers=headers)
+    assert response.status_code == 200
+    assert order() == [ids[0], ids[3], ids[1], ids[2]]
+
+    response = client.patch(f"/todos/{ids[0]}/move", json={"before_id": ids[2]}, headers=headers)
+    assert response.status_code == 200
+    assert order() == [ids[3], ids[1], ids[0], ids[2]]
+
+def test_todo_writes_filter_on_partition_key():
+    import re
+    from sqlalchemy import event
+    from app.services.ordering import rebalance_positions
+
+    headers = auth_headers("partitionuser")
+    ids = [client.post("/todos/", json={"title": f"P{i}"}, headers=headers).json()["id"] for i in range(2)]
+    user_id = client.get("/todos/", headers=headers).json()["todos"][0]["user_id"]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if re.match(r"\s*(UPDATE|DELETE FROM) todos\b", statement):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        assert client.put(f"/todos/{ids[0]}", json={"completed": True}, headers=headers).status_code == 200
+        assert client.patch(f"/todos/{ids[0]}/move", json={"after_id": ids[1]}, headers=headers).status_code == 200
+        db = TestingSessionLocal()
+        try:
+            rebalance_positions(db, user_id)
+        finally:
+            db.close()
+        assert client.delete(f"/todos/{ids[1]}", headers=headers).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    # Every kind of write ran, and each WHERE names user_id
+    assert {statement.split()[0] for statement in statements} == {"UPDATE", "DELETE"}
+    for statement in statements:
+        assert "user_id" in statement.split("WHERE", 1)[1], statement
+
+def test_loop_monitor_captures_blocking_call():
+    import asyncio
+    import time
+    from app.services.diagnostics import LoopLagMonitor
+
+    def block_the_loop():
+        time.sleep(0.3)
+
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.02, threshold=0.1)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        block_the_loop()
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return monitor.report()
+
+    report = asyncio.run(scenario())
+    assert len(report["blocking_events"]) == 1
+    event = report["blocking_events"][0]
+    assert event["blocked_ms"] >= 200
+    assert any("block_the_loop" in frame for frame in event["stack"])
+
+def test_filter_language_and_sort_whitelist():
+    headers = auth_headers("filteruser")
+    client.post("/todos/", json={"title": "Buy milk"}, headers=headers)
+    client.post("/todos/", json={"title": "Walk dog", "completed": True}, headers=headers)
+    client.post("/todos/", json={"title": "Call mom", "description": "about milk"}, headers=headers)
+
+    def titles(**params):
+        response = client.get("/todos/", params={"sort_by": "title", "sort_order": "asc", **params}, headers=headers)
+        assert response.status_code == 200, response.text
+        return [todo["title"] for todo in response.json()["todos"]]
+
+    assert titles(filter="milk") == ["Buy milk", "Call mom"]
+    assert titles(filter="completed:false AND text:milk") == ["Buy milk", "Call mom"]
+    assert titles(filter='completed:true AND ("walk" OR "buy")') == ["Walk dog"]
+    assert titles(filter='completed:true OR "buy"') == ["Buy milk", "Walk dog"]
+    assert titles(filter="created>=2000-01-01 completed:true") == ["Walk dog"]
+    assert titles(filter="created:..2000-01-01") == []
+
+    for sort_by in ("created_at", "updated_at", "title", "completed", "position", "id"):
+        assert client.get(f"/todos/?sort_by={sort_by}", headers=headers).status_code == 200
+
+    assert client.get("/todos/?sort_by=description", headers=headers).status_code == 400
+    assert client.get("/todos/?filter=completed:maybe", headers=headers).status_code == 400
+    assert client.get("/todos/?filter=(milk", headers=headers).status_code == 400
+    assert client.get("/todos/?filter=created:9999-12-31", headers=headers).status_code == 400
+    assert client.get("/todos/", params={"filter": "(" * 5000 + "a" + ")" * 5000}, headers=headers).status_code == 400
+    assert client.get("/todos/export/csv?sort_by=hashed_password", headers=headers).status_code == 400
+
+def test_working_set_answers_hot_user_lists_like_the_database(monkeypatch):
+    from app.database import settings
+    from app.metrics import metrics
+    from app.services.working_set import working_set
+
+    headers = auth_headers("hotuser")
+    for title, completed in (("b milk", False), ("a bread", True), ("c eggs", False), ("d milk", True)):
+        client.post("/todos/", json={"title": title, "completed": completed}, headers=headers)
+
+    queries = [
+        "",
+        "?sort_by=title&sort_order=asc",
+        "?sort_by=updated_at&sort_order=asc",
+        "?sort_by=position&sort_order=desc&skip=1&limit=2",
+        "?filter=milk%20OR%20completed:true&sort_by=id&sort_order=asc",
+    ]
+    expected = {query: client.get(f"/todos/{query}", headers=headers).json() for query in queries}
+
+    monkeypatch.setattr(settings, "working_set_enabled", True)
+    working_set.clear()
+    metrics.reset()
+    for _ in range(2):
+        for query in queries:
+            assert client.get(f"/todos/{query}", headers=headers).json() == expected[query]
+    assert metrics.snapshot()["counters"]["working_set.hits"] >= len(queries)
+
+    # A write drops the cached copy, so the next read sees it
+    client.post("/todos/", json={"title": "e milk"}, headers=headers)
+    assert client.get("/todos/?filter=milk", headers=headers).json()["total"] == 3
+
+def test_working_set_leaves_infrequent_readers_on_the_database(monkeypatch):
+    import time
+    from app.database import settings
+    from app.metrics import metrics
+    from app.services.working_set import WorkingSetCache
+
+    headers = auth_headers("coldreader")
+    client.post("/todos/", json={"title": "Rarely read"}, headers=headers)
+
+    cache = WorkingSetCache(max_bytes=1 << 20, max_todos=100, ttl=0.05, min_reads=2)
+    monkeypatch.setattr("app.services.todo.working_set", cache)
+    monkeypatch.setattr(settings, "working_set_enabled", True)
+    metrics.reset()
+
+    # Reads spaced further apart than the ttl never make the user hot
+    for _ in range(4):
+        assert client.get("/todos/", headers=headers).json()["total"] == 1
+        time.sleep(0.06)
+    assert metrics.snapshot()["counters"].get("working_set.loads", 0) == 0
+
+    # Back-to-back reads do
+    for _ in range(3):
+        client.get("/todos/", headers=headers)
+    counters = metrics.snapshot()["counters"]
+    assert counters["working_set.loads"] == 1
+    assert counters["working_set.hits"] == 1
+
+def test_debug_access_needs_the_admin_flag_not_a_username():
+    from fastapi import HTTPException
+    from app.models.user import User
+    from app.routers.debug import require_admin
+
+    auth_headers("admin")
+    db = TestingSessionLocal()
+    try:
+        # Registering a privileged-looking name grants nothing
+        account = db.query(User).filter(User.username == "admin").one()
+        assert account.is_admin is False
+        with pytest.raises(HTTPException) as rejected:
+            require_admin(account)
+        assert rejected.value.status_code == 403
+
+        account.is_admin = True
+        db.commit()
+        assert require_admin(account) is account
+    finally:
+        db.close()